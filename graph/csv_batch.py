@@ -0,0 +1,167 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+@author:lei
+@file:csv_batch.py
+@time:2025/07/13
+@邮箱：leigang431@163.com
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from csv_core import CSVModelCore, AlarmEngine
+
+# 命令行批量分析：不导入Qt，可在无显示的服务器上运行
+INT_FIELDS = ['count', 'nan_count', 'argmin', 'argmax', 'rule_events']
+STATS_FIELDS = ['file', 'column', 'count', 'nan_count', 'min', 'max', 'mean', 'p50', 'p95', 'p99',
+                'argmin', 'argmax', 'expected_max', 'alarm_threshold', 'alarm', 'rule_events', 'error']
+EVENT_FIELDS = ['file'] + AlarmEngine.EVENT_COLUMNS
+QUANTILES = (0.5, 0.95, 0.99)
+
+_model = None  # 每个子进程复用一个模型，配置只读取一次
+
+
+def init_worker(config_path, store_dir):
+    global _model
+    _model = CSVModelCore(config_path)
+    # 批量分析每个文件只读一次，不写解析缓存，避免多个进程同时写入和淘汰同一缓存目录；
+    # 超大文件的内存映射存储放在本进程独占的临时目录中，仍按内容哈希区分
+    _model.cache = None
+    _model.store_cache = _model.create_store_cache(tempfile.mkdtemp(dir=store_dir))
+
+
+def to_python(value):
+    """numpy标量转为Python类型，NaN转为None，便于写入JSON"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def analyze_file(file_path):
+    """在子进程中加载单个文件，返回(各列统计和报警行, 规则报警事件行)"""
+    model = _model
+    model.set_dataframe(*model.prepare_data(file_path))
+    model.calculate_stats()
+    rows = []
+    for column, stats in model.stats.items():
+        sketch = model.get_sketch(column)
+        quantiles = sketch.quantile(QUANTILES) if sketch is not None else [np.nan] * len(QUANTILES)
+        row = {'file': file_path, 'column': column}
+        row.update({key: stats[key] for key in ('count', 'nan_count', 'min', 'max', 'mean',
+                                                 'argmin', 'argmax')})
+        row.update(zip(('p50', 'p95', 'p99'), quantiles))
+        row['expected_max'] = model.get_expected_max(column)
+        row['alarm_threshold'] = model.get_alarm_threshold(column)
+        row['alarm'] = model.is_max_value_alarm(column, stats['max'])
+        rows.append(row)
+
+    events = model.get_alarm_events(list(model.stats))
+    counts = events['column'].value_counts()
+    for row in rows:
+        row['rule_events'] = int(counts.get(row['column'], 0))
+    events.insert(0, 'file', file_path)
+    rows = [{key: to_python(value) for key, value in row.items()} for row in rows]
+    events = [{key: to_python(value) for key, value in event.items()}
+              for event in events.to_dict('records')]
+    return rows, events
+
+
+def expand_paths(paths):
+    """文件、目录和通配符展开为CSV文件列表，去掉重复项"""
+    files = []
+    for path in paths:
+        files.extend(CSVModelCore.expand_sources(path))
+    return list(dict.fromkeys(files))
+
+
+def run_batch(files, config_path, workers):
+    """用进程池逐文件分析，结果按文件顺序合并；单个文件失败时记录错误并继续"""
+    results = [None] * len(files)
+    # 与界面保持一致，统一用spawn启动子进程；进程池关闭后再删除各进程的临时存储
+    with tempfile.TemporaryDirectory(prefix='csv_batch_') as store_dir, \
+            ProcessPoolExecutor(max_workers=max(1, min(workers, len(files))),
+                                mp_context=multiprocessing.get_context('spawn'),
+                                initializer=init_worker, initargs=(config_path, store_dir)) as executor:
+        futures = {executor.submit(analyze_file, path): i for i, path in enumerate(files)}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                print(f"处理失败: {files[i]}: {e}", file=sys.stderr)
+                results[i] = ([{'file': files[i], 'error': str(e)}], [])
+            print(f"[{done}/{len(files)}] {files[i]}", file=sys.stderr)
+
+    stats_rows = [row for rows, _ in results for row in rows]
+    event_rows = [event for _, events in results for event in events]
+    return stats_rows, event_rows
+
+
+def write_report(path, report_format, files, stats_rows, event_rows, config_path):
+    """JSON写成一个文件；CSV写统计表，规则报警事件写到同名的_events.csv"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if report_format == 'json':
+        report = {
+            'generated': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'config': os.path.abspath(config_path),
+            'files': len(files),
+            'alarms': sum(1 for row in stats_rows if row.get('alarm')),
+            'columns': stats_rows,
+            'events': event_rows
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return [path]
+
+    events_path = os.path.splitext(path)[0] + '_events.csv'
+    stats = pd.DataFrame(stats_rows, columns=STATS_FIELDS)
+    # 失败文件的空行会让整数列变为浮点数，改用可空整数类型
+    stats[INT_FIELDS] = stats[INT_FIELDS].astype('Int64')
+    # utf-8-sig便于Excel直接打开中文列名和路径
+    stats.to_csv(path, index=False, encoding='utf-8-sig')
+    pd.DataFrame(event_rows, columns=EVENT_FIELDS).to_csv(events_path, index=False,
+                                                          encoding='utf-8-sig')
+    return [path, events_path]
+
+
+def main(args):
+    files = expand_paths(args.src_path)
+    if not files:
+        print(f"未找到CSV文件: {' '.join(args.src_path)}", file=sys.stderr)
+        return 1
+    model = CSVModelCore(args.config)
+    workers = args.workers or model.config.getint('LOAD', 'workers', fallback=0) or os.cpu_count()
+    report_format = args.format or ('json' if args.output.lower().endswith('.json') else 'csv')
+
+    stats_rows, event_rows = run_batch(files, args.config, workers)
+    paths = write_report(args.output, report_format, files, stats_rows, event_rows, args.config)
+
+    alarms = sum(1 for row in stats_rows if row.get('alarm'))
+    errors = sum(1 for row in stats_rows if row.get('error'))
+    print(f"已处理{len(files)}个文件: {alarms}列超过报警阈值, {len(event_rows)}条规则报警事件, "
+          f"{errors}个文件失败")
+    print("报告已写入: " + ", ".join(paths))
+    return 2 if errors else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="批量统计CSV并按config.ini中的阈值检查报警")
+    parser.add_argument('src_path', nargs='+', type=str, help='CSV文件、目录或通配符')
+    parser.add_argument('-o', '--output', default='report.csv', type=str, help='报告文件路径')
+    parser.add_argument('-f', '--format', choices=['csv', 'json'], default=None,
+                        help='报告格式，默认按报告文件扩展名判断')
+    parser.add_argument('-c', '--config', default='config.ini', type=str, help='配置文件路径')
+    parser.add_argument('-w', '--workers', default=0, type=int,
+                        help='进程数，0表示使用配置中的LOAD.workers或CPU核数')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,1882 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+@author:lei
+@file:csv_core.py
+@time:2025/07/13
+@邮箱：leigang431@163.com
+"""
+import os
+import io
+import glob
+import json
+import pickle
+import codecs
+import random
+import sqlite3
+import shutil
+import hashlib
+import tempfile
+import time
+import configparser
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+import numpy as np
+
+
+# ================== 曲线抽稀 ==================
+class MinMaxPyramid:
+    """每列构建一次的最小/最大值金字塔，每升一层分辨率减半，任意缩放都从最接近的层取数"""
+    BASE_LEVEL = 3  # 最底层每个桶覆盖2^3个点，更细的层按需从原始数据计算
+    MIN_BUCKETS = 256  # 顶层桶数不少于该值时停止构建
+
+    def __init__(self, data):
+        self.data = data
+        self.levels = {}
+        mins, maxs = self.reduce_raw(0, len(data), 1 << self.BASE_LEVEL)
+        level = self.BASE_LEVEL
+        while True:
+            self.levels[level] = (mins, maxs)
+            if len(mins) <= self.MIN_BUCKETS:
+                break
+            mins, maxs = self.halve(mins, maxs)
+            level += 1
+        self.top_level = level
+
+    def extend(self, data, start=None):
+        """数据追加后只重算各层末尾受影响的桶，原来不满的最后一个桶也一并重算；
+        start为发生变化的第一行，默认为追加前的行数"""
+        first = (len(self.data) if start is None else start) >> self.BASE_LEVEL
+        self.data = data
+        mins, maxs = self.reduce_raw(first << self.BASE_LEVEL, len(data), 1 << self.BASE_LEVEL)
+        level = self.BASE_LEVEL
+        while True:
+            old_mins, old_maxs = self.levels.get(level, (mins[:0], maxs[:0]))
+            mins = np.concatenate([old_mins[:first], mins])
+            maxs = np.concatenate([old_maxs[:first], maxs])
+            self.levels[level] = (mins, maxs)
+            if len(mins) <= self.MIN_BUCKETS:
+                break
+            level += 1
+            # 新增的层从下一层整体合并得到
+            first = first // 2 if level in self.levels else 0
+            mins, maxs = self.halve(mins[first * 2:], maxs[first * 2:])
+        self.top_level = level
+
+    @staticmethod
+    def halve(mins, maxs):
+        m = len(mins) // 2 * 2
+        new_mins = np.fmin(mins[0:m:2], mins[1:m:2])
+        new_maxs = np.fmax(maxs[0:m:2], maxs[1:m:2])
+        if len(mins) % 2:
+            new_mins = np.append(new_mins, mins[-1])
+            new_maxs = np.append(new_maxs, maxs[-1])
+        return new_mins, new_maxs
+
+    def reduce_raw(self, start, stop, bucket):
+        """直接从原始数据计算[start, stop)内每bucket个点的最小/最大值"""
+        values = np.asarray(self.data[start:stop], dtype='float64')
+        # 整桶部分直接reshape（memmap仍只是视图），最后不满的桶单独计算，不复制整段数据
+        full = len(values) - len(values) % bucket
+        blocks = values[:full].reshape(-1, bucket)
+        mins, maxs = np.fmin.reduce(blocks, axis=1), np.fmax.reduce(blocks, axis=1)
+        if full < len(values):
+            mins = np.append(mins, np.fmin.reduce(values[full:]))
+            maxs = np.append(maxs, np.fmax.reduce(values[full:]))
+        return mins, maxs
+
+    def value_range(self):
+        """整列的最小值和最大值，直接取顶层"""
+        mins, maxs = self.levels[self.top_level]
+        if len(mins) == 0:
+            return np.nan, np.nan
+        return np.fmin.reduce(mins), np.fmax.reduce(maxs)
+
+    def envelope(self, start, stop, pixels):
+        """返回可见范围的包络x、y及每个桶的最大值，点数与像素数成正比"""
+        span = stop - start
+        level = max(0, int(np.log2(span / pixels))) if span > pixels else 0
+        level = min(level, self.top_level)
+        bucket = 1 << level
+        i0 = start // bucket
+        i1 = -(-stop // bucket)
+        if level < self.BASE_LEVEL:
+            # 可见点数不超过像素数的2^BASE_LEVEL倍，直接扫描原始数据
+            mins, maxs = self.reduce_raw(i0 * bucket, min(len(self.data), i1 * bucket), bucket)
+        else:
+            mins, maxs = self.levels[level]
+            i1 = min(i1, len(mins))
+            mins, maxs = mins[i0:i1], maxs[i0:i1]
+        centers = np.arange(i0, i0 + len(mins)) * bucket + (bucket - 1) / 2
+        y = np.empty(len(mins) * 2)
+        y[0::2], y[1::2] = mins, maxs
+        return np.repeat(centers, 2), y, centers, maxs
+
+
+# ================== 超限索引 ==================
+class ExceedanceIndex:
+    """按值排序的行号索引，任意阈值的超限点数和所在行都由二分查找得到"""
+
+    def __init__(self, data):
+        values = np.asarray(data, dtype='float64')
+        # NaN排在末尾，不参与比较
+        self.order = np.argsort(values, kind='stable')
+        self.sorted_values = values[self.order]
+        self.valid = len(values) - int(np.count_nonzero(np.isnan(values)))
+
+    @classmethod
+    def from_sorted(cls, order, sorted_values):
+        """由已按值排序（NaN在末尾）的行号和值直接构造，二者可以是memmap"""
+        index = cls.__new__(cls)
+        index.order = order
+        index.sorted_values = sorted_values
+        index.valid = int(np.searchsorted(sorted_values, np.nan))
+        return index
+
+    def extend(self, values, start):
+        """把从第start行起追加的值按值插入已排序的索引，不重新排序整列；
+        start之后原有的行（被替换的临时行）先从索引中去掉"""
+        if start < len(self.order):
+            keep = self.order < start
+            self.valid -= int(np.count_nonzero(~keep[:self.valid]))
+            self.order, self.sorted_values = self.order[keep], self.sorted_values[keep]
+        values = np.asarray(values, dtype='float64')
+        order = np.argsort(values, kind='stable')
+        new_sorted = values[order]
+        valid = len(values) - int(np.count_nonzero(np.isnan(values)))
+        # 值相同时新行排在旧行之后，与整列稳定排序的结果一致；NaN仍排在末尾
+        pos = np.searchsorted(self.sorted_values[:self.valid], new_sorted[:valid], side='right')
+        self.sorted_values = np.concatenate([
+            np.insert(self.sorted_values, pos, new_sorted[:valid]), new_sorted[valid:]])
+        self.order = np.concatenate([
+            np.insert(self.order, pos, start + order[:valid]), start + order[valid:]])
+        self.valid += valid
+
+    def first_above(self, threshold):
+        return int(np.searchsorted(self.sorted_values[:self.valid], threshold, side='right'))
+
+    def count_above(self, threshold):
+        return self.valid - self.first_above(threshold)
+
+    def rows_above(self, threshold, limit=None):
+        """超过阈值的行号，按值从大到小排列"""
+        start = self.first_above(threshold)
+        if limit is not None:
+            start = max(start, self.valid - limit)
+        return self.order[start:self.valid][::-1]
+
+
+# ================== 编码检测 ==================
+def gbk_fallback_handler(error):
+    """UTF-8解码出错时就地按GBK解码出错的字节，避免整文件重新解析"""
+    start = error.start
+    try:
+        return error.object[start:start + 2].decode('gbk'), start + 2
+    except UnicodeDecodeError:
+        return '\ufffd', error.end
+
+
+codecs.register_error('gbk_fallback', gbk_fallback_handler)
+
+
+def detect_encoding(file_path, sample_size=65536, sample_count=8):
+    """抽样文件头部和若干随机位置判断编码，只需读取少量字节"""
+    file_size = os.path.getsize(file_path)
+    samples = []
+    with open(file_path, 'rb') as f:
+        head = f.read(sample_size)
+        if head.startswith(codecs.BOM_UTF8):
+            return 'utf-8-sig'
+        samples.append(head[:head.rfind(b'\n') + 1] if len(head) == sample_size else head)
+        if file_size > sample_size * 2:
+            rng = random.Random(file_size)
+            for offset in sorted(rng.randrange(sample_size, file_size - sample_size)
+                                 for _ in range(sample_count)):
+                f.seek(offset)
+                block = f.read(sample_size)
+                # 只保留完整的行，避免截断多字节字符
+                block = block[block.find(b'\n') + 1:block.rfind(b'\n') + 1]
+                samples.append(block)
+
+    for encoding in ('utf-8', 'gbk'):
+        try:
+            for block in samples:
+                block.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return 'gbk'
+
+
+# ================== 二进制旁路缓存 ==================
+class CSVCache:
+    """按文件路径、大小、修改时间和内容哈希缓存解析结果，数值列按列存为.npy"""
+    HASH_BLOCK = 1024 * 1024  # 内容哈希只读取首尾各1MB
+    FORMAT_VERSION = '2'  # 缓存内容格式变化时递增，使旧缓存失效
+
+    def __init__(self, cache_dir='.csv_cache', max_size_mb=2048):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+
+    def make_key(self, file_path, variant=''):
+        st = os.stat(file_path)
+        h = hashlib.sha1()
+        h.update(os.path.abspath(file_path).encode('utf-8'))
+        h.update(f"{self.FORMAT_VERSION}:{variant}".encode('utf-8'))
+        h.update(f"{st.st_size}:{st.st_mtime_ns}".encode('utf-8'))
+        with open(file_path, 'rb') as f:
+            h.update(f.read(self.HASH_BLOCK))
+            if st.st_size > self.HASH_BLOCK:
+                f.seek(max(self.HASH_BLOCK, st.st_size - self.HASH_BLOCK))
+                h.update(f.read(self.HASH_BLOCK))
+        return h.hexdigest()
+
+    def entry_path(self, file_path, variant=''):
+        return os.path.join(self.cache_dir, self.make_key(file_path, variant))
+
+    def load(self, file_path, variant=''):
+        """命中时返回(df, stats, sketches)，否则返回None"""
+        entry = self.entry_path(file_path, variant)
+        meta_path = os.path.join(entry, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            others = pd.read_pickle(os.path.join(entry, 'others.pkl'))
+            data = {}
+            for i, col in enumerate(meta['columns']):
+                if i in meta['npy_columns']:
+                    data[col] = np.load(os.path.join(entry, f'col_{i}.npy'))
+                else:
+                    data[col] = others[col].values
+            df = pd.DataFrame(data, columns=meta['columns'])
+            df.attrs.update(meta.get('attrs', {}))
+            with open(os.path.join(entry, 'stats.pkl'), 'rb') as f:
+                stats = pickle.load(f)
+        except Exception as e:
+            print(f"读取缓存失败: {e}")
+            return None
+        sketches = ColumnSketch.load_file(os.path.join(entry, 'sketches.pkl'))
+        # 更新访问时间，用于LRU淘汰
+        os.utime(meta_path)
+        return df, stats, sketches
+
+    def save_stats(self, entry, stats):
+        """只更新缓存中的统计信息（懒计算的列统计会陆续补充进来）"""
+        if not os.path.exists(os.path.join(entry, 'meta.json')):
+            return
+        tmp_path = os.path.join(entry, 'stats.pkl.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(stats, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, os.path.join(entry, 'stats.pkl'))
+        except Exception as e:
+            print(f"写入缓存失败: {e}")
+
+    def save_sketches(self, entry, sketches):
+        if not os.path.exists(os.path.join(entry, 'meta.json')):
+            return
+        try:
+            ColumnSketch.save_file(os.path.join(entry, 'sketches.pkl'), sketches)
+        except Exception as e:
+            print(f"写入缓存失败: {e}")
+
+    def save(self, file_path, df, stats, variant='', sketches=None):
+        key = self.make_key(file_path, variant)
+        entry = os.path.join(self.cache_dir, key)
+        tmp_entry = entry + '.tmp'
+        df.attrs['cache_entry'] = entry
+        try:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            os.makedirs(tmp_entry)
+            npy_columns = []
+            for i, col in enumerate(df.columns):
+                values = df[col].values
+                if isinstance(values, np.ndarray) and values.dtype.kind in 'biuf':
+                    np.save(os.path.join(tmp_entry, f'col_{i}.npy'), values)
+                    npy_columns.append(i)
+            others = df.iloc[:, [i for i in range(df.shape[1]) if i not in npy_columns]]
+            others.to_pickle(os.path.join(tmp_entry, 'others.pkl'))
+            with open(os.path.join(tmp_entry, 'stats.pkl'), 'wb') as f:
+                pickle.dump(stats, f, protocol=pickle.HIGHEST_PROTOCOL)
+            if sketches:
+                ColumnSketch.save_file(os.path.join(tmp_entry, 'sketches.pkl'), sketches)
+            # meta.json最后写入，存在即表示缓存完整
+            with open(os.path.join(tmp_entry, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump({'source': os.path.abspath(file_path),
+                           'columns': [str(col) for col in df.columns],
+                           'npy_columns': npy_columns,
+                           'attrs': df.attrs}, f, ensure_ascii=False)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmp_entry, entry)
+        except Exception as e:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            print(f"写入缓存失败: {e}")
+            return
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """超过容量上限时按最近访问时间淘汰旧缓存；跳过正在写入的.tmp目录"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.tmp'):
+                continue
+            entry = os.path.join(self.cache_dir, name)
+            meta_path = os.path.join(entry, 'meta.json')
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, fn)) for fn in os.listdir(entry))
+                mtime = os.path.getmtime(meta_path)
+            except OSError:
+                # 不完整的缓存，或已被其他进程替换、删除
+                continue
+            entries.append((mtime, name, size))
+            total += size
+
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            total -= size
+
+
+# ================== 内存映射数值列存储 ==================
+class ColumnStore:
+    """将数值列逐块写入二进制文件，通过np.memmap按需读取，用于超过内存的CSV"""
+    BLOCK_ROWS = 1000000  # 统计时每次扫描的行数
+    STATS_FILE = 'stats_v2.pkl'  # 统计格式变化时更换文件名
+    SKETCH_FILE = 'sketches.pkl'
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.columns = []
+        self.rows = 0
+        self.arrays = {}
+
+    @staticmethod
+    def source_signature(file_path):
+        """源文件的大小和修改时间，写入meta.json，与当前文件不一致时重新转换"""
+        st = os.stat(file_path)
+        return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+    def is_complete(self, source=None):
+        meta_path = os.path.join(self.store_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return False
+        if source is None:
+            return True
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('source') == source
+        except (OSError, ValueError):
+            return False
+
+    def convert(self, chunks, is_cancelled=None, source=None):
+        """逐块写入数值列（统一存为float64）并同时更新分布草图，被取消时返回False；
+        source为源文件签名，一并写入meta.json"""
+        tmp_dir = self.store_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        files = None
+        rows = 0
+        sketches = {}
+        completed = False
+        try:
+            for chunk in chunks:
+                if is_cancelled and is_cancelled():
+                    return False
+                if files is None:
+                    # 以第一块的类型确定数值列，后续块中的非数值内容按NaN处理
+                    self.columns = [col for col in chunk.columns
+                                    if pd.api.types.is_numeric_dtype(chunk[col])]
+                    files = [open(os.path.join(tmp_dir, f'col_{i}.bin'), 'wb')
+                             for i in range(len(self.columns))]
+                for col, f in zip(self.columns, files):
+                    values = np.asarray(pd.to_numeric(chunk[col], errors='coerce'), dtype='float64')
+                    values.tofile(f)
+                    sketches.setdefault(col, ColumnSketch()).update(values)
+                rows += len(chunk)
+            completed = True
+        finally:
+            for f in files or []:
+                f.close()
+            if not completed:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        ColumnSketch.save_file(os.path.join(tmp_dir, self.SKETCH_FILE), sketches)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'columns': self.columns, 'rows': rows, 'source': source}, f, ensure_ascii=False)
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+        os.replace(tmp_dir, self.store_dir)
+        return True
+
+    def open(self):
+        meta_path = os.path.join(self.store_dir, 'meta.json')
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        os.utime(meta_path)
+        self.columns = meta['columns']
+        self.rows = meta['rows']
+        self.arrays = {}
+        for i, col in enumerate(self.columns):
+            if self.rows:
+                self.arrays[col] = np.memmap(os.path.join(self.store_dir, f'col_{i}.bin'),
+                                             dtype='float64', mode='r', shape=(self.rows,))
+            else:
+                self.arrays[col] = np.empty(0, dtype='float64')
+        return self
+
+    def to_dataframe(self):
+        # copy=False保证各列仍由memmap支撑，不会整体读入内存
+        return pd.DataFrame(self.arrays, columns=self.columns, copy=False)
+
+    def load_stats(self):
+        stats_path = os.path.join(self.store_dir, self.STATS_FILE)
+        if not os.path.exists(stats_path):
+            return {}
+        with open(stats_path, 'rb') as f:
+            return pickle.load(f)
+
+    def save_stats(self, stats):
+        with open(os.path.join(self.store_dir, self.STATS_FILE), 'wb') as f:
+            pickle.dump(stats, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load_sketches(self):
+        return ColumnSketch.load_file(os.path.join(self.store_dir, self.SKETCH_FILE))
+
+    def save_sketches(self, sketches):
+        ColumnSketch.save_file(os.path.join(self.store_dir, self.SKETCH_FILE), sketches)
+
+    def exceedance_index(self, column):
+        """超限索引的已排序值和行号写在存储目录中并以memmap打开，不常驻内存；已构建的直接打开"""
+        if not self.rows:
+            return ExceedanceIndex(np.empty(0))
+        i = self.columns.index(column)
+        values_path = os.path.join(self.store_dir, f'index_{i}_values.bin')
+        order_path = os.path.join(self.store_dir, f'index_{i}_order.bin')
+        if not (os.path.exists(values_path) and os.path.exists(order_path)):
+            self.sort_column(self.arrays[column], values_path, order_path)
+        return ExceedanceIndex.from_sorted(
+            np.memmap(order_path, dtype='int64', mode='r', shape=(self.rows,)),
+            np.memmap(values_path, dtype='float64', mode='r', shape=(self.rows,)))
+
+    def sort_column(self, data, values_path, order_path):
+        """外部排序：逐块稳定排序写入临时文件，再相邻两段逐块归并，内存中只保留几个块"""
+        n = self.rows
+        paths = [values_path + '.tmp', order_path + '.tmp', values_path + '.tmp2', order_path + '.tmp2']
+        try:
+            src = (np.memmap(paths[0], dtype='float64', mode='w+', shape=(n,)),
+                   np.memmap(paths[1], dtype='int64', mode='w+', shape=(n,)))
+            dst = (np.memmap(paths[2], dtype='float64', mode='w+', shape=(n,)),
+                   np.memmap(paths[3], dtype='int64', mode='w+', shape=(n,)))
+            runs = []  # (起始, 结束, 非NaN个数)，每段内NaN排在末尾
+            for start in range(0, n, self.BLOCK_ROWS):
+                values = np.asarray(data[start:start + self.BLOCK_ROWS])
+                order = np.argsort(values, kind='stable')
+                src[0][start:start + len(values)] = values[order]
+                src[1][start:start + len(values)] = order + start
+                runs.append((start, start + len(values),
+                             len(values) - int(np.count_nonzero(np.isnan(values)))))
+            while len(runs) > 1:
+                merged = []
+                for k in range(0, len(runs), 2):
+                    if k + 1 < len(runs):
+                        merged.append(self.merge_runs(src, dst, runs[k], runs[k + 1]))
+                    else:
+                        self.copy_range(src, dst, runs[k][0], runs[k][1], runs[k][0])
+                        merged.append(runs[k])
+                runs = merged
+                src, dst = dst, src
+            for arr in src + dst:
+                arr.flush()
+            result = [arr.filename for arr in src]
+            del src, dst, arr
+            os.replace(result[0], values_path)
+            os.replace(result[1], order_path)
+        finally:
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def merge_runs(self, src, dst, a, b):
+        """把相邻的两段已排序数据逐块归并到dst；值相同时前一段在前，与整列稳定排序一致"""
+        a_lo, a_hi, a_valid = a
+        b_lo, b_hi, b_valid = b
+        i, j, out = a_lo, b_lo, a_lo
+        a_end, b_end = a_lo + a_valid, b_lo + b_valid
+        block = self.BLOCK_ROWS
+        while i < a_end or j < b_end:
+            a_values = src[0][i:min(i + block, a_end)]
+            b_values = src[0][j:min(j + block, b_end)]
+            a_last = i + len(a_values) == a_end
+            b_last = j + len(b_values) == b_end
+            if a_last and b_last:
+                na, nb = len(a_values), len(b_values)
+            else:
+                # 只输出不大于两块末尾值中较小者的部分，之后读入的值都不会比它们小
+                limit = min(([] if a_last else [a_values[-1]]) + ([] if b_last else [b_values[-1]]))
+                na = int(np.searchsorted(a_values, limit, side='right'))
+                # 前一段之后可能还有等于limit的值，此时后一段的相同值留到下次输出
+                strict = not a_last and a_values[-1] == limit
+                nb = int(np.searchsorted(b_values, limit, side='left' if strict else 'right'))
+            values = np.concatenate([a_values[:na], b_values[:nb]])
+            rows = np.concatenate([src[1][i:i + na], src[1][j:j + nb]])
+            order = np.argsort(values, kind='stable')
+            dst[0][out:out + len(values)] = values[order]
+            dst[1][out:out + len(values)] = rows[order]
+            i, j, out = i + na, j + nb, out + len(values)
+        # NaN按行号排在最后：前一段的在前
+        out = self.copy_range(src, dst, a_end, a_hi, out)
+        self.copy_range(src, dst, b_end, b_hi, out)
+        return a_lo, b_hi, a_valid + b_valid
+
+    def copy_range(self, src, dst, lo, hi, out):
+        for start in range(lo, hi, self.BLOCK_ROWS):
+            stop = min(start + self.BLOCK_ROWS, hi)
+            dst[0][out:out + stop - start] = src[0][start:stop]
+            dst[1][out:out + stop - start] = src[1][start:stop]
+            out += stop - start
+        return out
+
+    def compute_stats(self, columns=None):
+        """按块扫描memmap计算统计信息，只触及需要的页"""
+        stats = {}
+        for col in columns if columns is not None else self.columns:
+            arr = self.arrays[col]
+            min_val, max_val = np.inf, -np.inf
+            argmin = argmax = -1
+            total, count = 0.0, 0
+            for start in range(0, self.rows, self.BLOCK_ROWS):
+                block = np.asarray(arr[start:start + self.BLOCK_ROWS])
+                n = block.size - int(np.isnan(block).sum())
+                if n == 0:
+                    continue
+                total += float(np.nansum(block))
+                count += n
+                i, j = np.nanargmin(block), np.nanargmax(block)
+                if block[i] < min_val:
+                    min_val, argmin = block[i], start + int(i)
+                if block[j] > max_val:
+                    max_val, argmax = block[j], start + int(j)
+            if count == 0:
+                min_val = max_val = np.nan
+            stats[col] = {
+                'min': min_val,
+                'max': max_val,
+                'mean': total / count if count else np.nan,
+                'count': count,
+                'nan_count': self.rows - count,
+                'argmin': argmin,
+                'argmax': argmax
+            }
+        return stats
+
+
+# ================== 预期最大值配置 ==================
+class ThresholdConfig:
+    """预期最大值配置的类型化缓存：数值只在加载或修改时解析一次，查询时不再解析字符串"""
+
+    def __init__(self, config):
+        self.optionxform = config.optionxform  # 与configparser一致，列名不区分大小写
+        section = config['EXPECTED_MAX']
+        self.enabled = section.getboolean('enabled', fallback=True)
+        self.color = section.get('color', fallback='#00FF00')
+        width = self.parse_float(section.get('width', fallback='2'))
+        self.width = 2 if width is None else width
+        self.style = section.get('style', fallback='dash')
+        alarm_threshold = self.parse_float(section.get('alarm_threshold', fallback='1.05'))
+        self.alarm_threshold = 1.05 if alarm_threshold is None else alarm_threshold
+        self.default_value = self.parse_float(section.get('default_value'))
+        columns = config['COLUMN_SPECIFIC'] if 'COLUMN_SPECIFIC' in config else {}
+        # 无法解析的列配置记为None，与原先解析失败时的行为一致
+        self.column_values = {key: self.parse_float(value) for key, value in columns.items()}
+
+    @staticmethod
+    def parse_float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, column_name):
+        key = self.optionxform(column_name)
+        if key in self.column_values:
+            return self.column_values[key]
+        return self.default_value
+
+    def set(self, column_name, value):
+        self.column_values[self.optionxform(column_name)] = float(value)
+
+
+# ================== 报警历史 ==================
+class AlarmHistory:
+    """报警历史：内存中只保留最近capacity条结构化记录，同一来源、列和阈值只记录一次，
+    新记录攒够flush_size条后批量追加到SQLite，查询时按列和时间走索引"""
+    FIELDS = ('time', 'source', 'column_name', 'threshold', 'value', 'message')
+
+    def __init__(self, path='alarm_history.db', capacity=1000, flush_size=50):
+        self.path = path
+        self.capacity = capacity
+        self.flush_size = flush_size
+        self.records = deque(maxlen=capacity)  # 环形缓冲区，超出容量时丢弃最旧的记录
+        self.seen = OrderedDict()  # 去重键，同样限制数量
+        self.pending = []
+        self.conn = None
+
+    def connect(self):
+        if self.conn is None and self.path:
+            self.conn = sqlite3.connect(self.path)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS alarm_history ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, time REAL NOT NULL, source TEXT, "
+                "column_name TEXT NOT NULL, threshold REAL, value REAL, message TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_alarm_column_time "
+                              "ON alarm_history (column_name, time)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_alarm_time ON alarm_history (time)")
+            self.conn.commit()
+        return self.conn
+
+    def record(self, column_name, threshold, value, message, source=''):
+        """记录一次报警，同一来源、列和阈值已记录过时返回False"""
+        key = (source, column_name, round(threshold, 6))
+        if key in self.seen:
+            self.seen.move_to_end(key)
+            return False
+        self.seen[key] = True
+        if len(self.seen) > self.capacity:
+            self.seen.popitem(last=False)
+
+        record = dict(zip(self.FIELDS, (time.time(), source, column_name,
+                                        float(threshold), float(value), message)))
+        self.records.append(record)
+        self.pending.append(record)
+        if len(self.pending) >= self.flush_size:
+            self.flush()
+        return True
+
+    def flush(self):
+        """把尚未写入的记录批量追加到数据库"""
+        if not self.pending:
+            return
+        conn = self.connect()
+        if conn is None:
+            self.pending = []
+            return
+        with conn:
+            conn.executemany(
+                "INSERT INTO alarm_history (time, source, column_name, threshold, value, message) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [tuple(record[field] for field in self.FIELDS) for record in self.pending])
+        self.pending = []
+
+    def query(self, column_name=None, since=None, until=None, limit=None):
+        """按列和时间范围(时间戳，秒)查询报警记录，新记录在前；未启用持久化时只查内存中的记录"""
+        self.flush()
+        if self.conn is None and not self.path:
+            records = [r for r in reversed(self.records)
+                       if (column_name is None or r['column_name'] == column_name)
+                       and (since is None or r['time'] >= since)
+                       and (until is None or r['time'] < until)]
+            return records[:limit] if limit is not None else records
+
+        conditions, params = [], []
+        if column_name is not None:
+            conditions.append("column_name = ?")
+            params.append(column_name)
+        if since is not None:
+            conditions.append("time >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("time < ?")
+            params.append(until)
+        sql = "SELECT " + ", ".join(self.FIELDS) + " FROM alarm_history"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY time DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [dict(zip(self.FIELDS, row)) for row in self.connect().execute(sql, params)]
+
+    def close(self):
+        self.flush()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# ================== 流式分位数草图 ==================
+class ColumnSketch:
+    """可合并的单列分布草图，分块加载时逐块更新，不保留排序副本：
+    分位数用KLL式分层压缩样本（第h层每个样本代表2^h个值），直方图用固定个数、宽度可倍增的分箱"""
+    CAPACITY = 2048  # 每层最多保留的样本数
+    BINS = 128  # 直方图分箱数
+
+    def __init__(self):
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self.hist_low = None
+        self.hist_width = None
+        self.hist_counts = np.zeros(self.BINS)
+        self.rng = np.random.default_rng(0)
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return
+        self.count += values.size
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+        self.add_to_histogram(values)
+
+    def compress(self):
+        """超出容量的层排序后隔一个取一个升入上一层（权重加倍），随机选取奇偶位置使秩误差无偏"""
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if items.size > self.CAPACITY:
+                items = np.sort(items)
+                # 奇数个时留下最后一个，其余成对压缩
+                paired = items.size - items.size % 2
+                self.levels[h] = items[paired:]
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                promoted = items[int(self.rng.integers(2)):paired:2]
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def add_to_histogram(self, values, weights=None):
+        lo, hi = values.min(), values.max()
+        if self.hist_low is None:
+            self.hist_low = lo
+            self.hist_width = (hi - lo) / self.BINS if hi > lo else max(abs(lo), 1.0) / self.BINS
+        # 超出当前范围时相邻分箱两两合并、宽度加倍，并向超出的一侧扩展
+        while lo < self.hist_low or hi > self.hist_low + self.BINS * self.hist_width:
+            merged = self.hist_counts.reshape(-1, 2).sum(axis=1)
+            empty = np.zeros(self.BINS // 2)
+            if lo < self.hist_low:
+                self.hist_counts = np.concatenate([empty, merged])
+                self.hist_low -= self.BINS * self.hist_width
+            else:
+                self.hist_counts = np.concatenate([merged, empty])
+            self.hist_width *= 2
+        bins = np.clip(((values - self.hist_low) / self.hist_width).astype(np.int64), 0, self.BINS - 1)
+        self.hist_counts += np.bincount(bins, weights=weights, minlength=self.BINS)
+
+    def merge(self, other):
+        """合并另一个草图；直方图按对方的分箱中心重新分箱"""
+        if other is None or other.count == 0:
+            return self
+        if self.count == 0:
+            self.hist_low, self.hist_width = other.hist_low, other.hist_width
+            self.hist_counts = other.hist_counts.copy()
+        else:
+            centers = other.hist_low + (np.arange(self.BINS) + 0.5) * other.hist_width
+            used = other.hist_counts > 0
+            self.add_to_histogram(centers[used], other.hist_counts[used])
+        self.count += other.count
+        for h, items in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.compress()
+        return self
+
+    def quantile(self, q):
+        """近似分位数，q可为标量或序列；没有有效值时返回NaN"""
+        q = np.asarray(q, dtype='float64')
+        if self.count == 0:
+            return np.full(q.shape, np.nan) if q.ndim else np.nan
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(items.size, 2.0 ** h)
+                                  for h, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        cum = np.cumsum(weights[order])
+        idx = np.searchsorted(cum, q * cum[-1], side='left')
+        return values[order][np.clip(idx, 0, values.size - 1)]
+
+    def histogram(self):
+        """返回(分箱边界, 计数)，去掉两端的空分箱"""
+        if self.count == 0:
+            return np.empty(0), np.empty(0)
+        used = np.flatnonzero(self.hist_counts)
+        first, last = used[0], used[-1] + 1
+        edges = self.hist_low + np.arange(first, last + 1) * self.hist_width
+        return edges, self.hist_counts[first:last]
+
+    @classmethod
+    def update_columns(cls, sketches, chunk):
+        """用一块数据更新各列的草图；出现非数值内容的列记为None，之后按需从整列重建"""
+        for col in chunk.columns:
+            if col in sketches and sketches[col] is None:
+                continue
+            if not pd.api.types.is_numeric_dtype(chunk[col]):
+                sketches[col] = None
+                continue
+            values = chunk[col].to_numpy(dtype='float64', na_value=np.nan)
+            sketches.setdefault(col, cls()).update(values)
+        return sketches
+
+    @staticmethod
+    def to_states(sketches):
+        """转为只含数值和数组的字典，用于跨进程传递和写入缓存"""
+        return {col: None if sketch is None else
+                {'count': sketch.count, 'levels': sketch.levels, 'hist_low': sketch.hist_low,
+                 'hist_width': sketch.hist_width, 'hist_counts': sketch.hist_counts}
+                for col, sketch in sketches.items()}
+
+    @classmethod
+    def merge_states(cls, sketches, states):
+        """把另一部分数据的草图状态合并进来，任一部分作废的列整体作废"""
+        for col, state in states.items():
+            if col in sketches and sketches[col] is None:
+                continue
+            if state is None:
+                sketches[col] = None
+                continue
+            sketch = cls()
+            sketch.count = state['count']
+            sketch.levels = list(state['levels'])
+            sketch.hist_low, sketch.hist_width = state['hist_low'], state['hist_width']
+            sketch.hist_counts = state['hist_counts']
+            if col in sketches:
+                sketches[col].merge(sketch)
+            else:
+                sketches[col] = sketch
+        return sketches
+
+    @classmethod
+    def save_file(cls, path, sketches):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(cls.to_states(sketches), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_file(cls, path):
+        """文件不存在或读取失败时返回空字典，草图之后按需重建"""
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'rb') as f:
+                return cls.merge_states({}, pickle.load(f))
+        except Exception as e:
+            print(f"读取分布草图失败: {e}")
+            return {}
+
+
+# ================== 滚动窗口统计 ==================
+class RollingStats:
+    """以每行结尾的窗口统计，全部O(n)向量化：均值和标准差用累加和相减，
+    最小/最大值用分块前缀/后缀极值（van Herk/Gil-Werman），NaN不计入，窗口未满时为NaN"""
+    STATISTICS = OrderedDict([
+        ('mean', '移动平均'),
+        ('min', '滚动最小值'),
+        ('max', '滚动最大值'),
+        ('std', '滚动标准差'),
+    ])
+
+    @classmethod
+    def compute(cls, statistic, values, window):
+        values = np.asarray(values, dtype='float64')
+        if statistic == 'mean':
+            return cls.mean(values, window)
+        if statistic == 'std':
+            return cls.std(values, window)
+        if statistic == 'max':
+            return cls.window_max(values, window)
+        if statistic == 'min':
+            return -cls.window_max(-values, window)
+        raise ValueError(f"未知的滚动统计量: {statistic}")
+
+    @staticmethod
+    def window_sums(values, window, power=1):
+        """窗口内有效值的个数及(values**power)之和，长度为n - window + 1"""
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0.0) ** power
+        sums = np.concatenate([[0.0], np.cumsum(filled)])
+        counts = np.concatenate([[0], np.cumsum(valid)])
+        return counts[window:] - counts[:-window], sums[window:] - sums[:-window]
+
+    @classmethod
+    def mean(cls, values, window):
+        out = np.full(len(values), np.nan)
+        if len(values) >= window:
+            counts, sums = cls.window_sums(values, window)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out[window - 1:] = sums / counts
+        return out
+
+    @classmethod
+    def std(cls, values, window):
+        """样本标准差(ddof=1)，先减去整列均值，减小平方和相减的舍入误差"""
+        out = np.full(len(values), np.nan)
+        if len(values) >= window and window > 1:
+            shifted = values - np.nanmean(values) if np.isfinite(values).any() else values
+            counts, sums = cls.window_sums(shifted, window)
+            _, squares = cls.window_sums(shifted, window, power=2)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                var = (squares - sums * sums / counts) / (counts - 1)
+            var[counts < 2] = np.nan
+            out[window - 1:] = np.sqrt(np.clip(var, 0, None))
+        return out
+
+    @staticmethod
+    def window_max(values, window):
+        out = np.full(len(values), np.nan)
+        n = len(values)
+        if n < window:
+            return out
+        x = np.where(np.isnan(values), -np.inf, values)
+        # 按窗口长度分块：窗口最多跨两个相邻块，取前一块的后缀最大值和后一块的前缀最大值
+        blocks = np.concatenate([x, np.full(-n % window, -np.inf)]).reshape(-1, window)
+        prefix = np.maximum.accumulate(blocks, axis=1).ravel()
+        suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+        result = np.maximum(suffix[:n - window + 1], prefix[window - 1:n])
+        result[np.isneginf(result)] = np.nan  # 窗口内全是NaN
+        out[window - 1:] = result
+        return out
+
+
+# ================== 报警规则引擎 ==================
+class AlarmEngine:
+    """按配置中的[RULE 名称]规则对整列做向量化检查，输出(规则, 列, 起始行, 结束行, 峰值)事件表"""
+    RULE_TYPES = ('threshold', 'rate', 'rolling_mean', 'consecutive')
+    EVENT_COLUMNS = ['rule', 'column', 'start', 'end', 'peak']
+
+    def __init__(self, rules):
+        self.rules = rules
+
+    @classmethod
+    def from_config(cls, config):
+        rules = []
+        for section in config.sections():
+            if not section.startswith('RULE '):
+                continue
+            options = config[section]
+            if not options.getboolean('enabled', fallback=True):
+                continue
+            rule_type = options.get('type', 'threshold').strip()
+            if rule_type not in cls.RULE_TYPES:
+                print(f"忽略报警规则{section}: 未知类型{rule_type}")
+                continue
+            columns = options.get('columns', '*').strip()
+            rules.append({
+                'name': section[len('RULE '):].strip(),
+                'type': rule_type,
+                'columns': None if columns == '*' else {c.strip() for c in columns.split(',') if c.strip()},
+                # limit为expected时取该列的预期最大值，否则为固定数值，都再乘以factor
+                'limit': options.get('limit', 'expected').strip(),
+                'factor': options.getfloat('factor', fallback=1.0),
+                'window': max(1, options.getint('window', fallback=1)),
+                'count': max(1, options.getint('count', fallback=1)),
+            })
+        return cls(rules)
+
+    def resolve_limit(self, rule, column, thresholds):
+        if rule['limit'] == 'expected':
+            limit = thresholds.get(column)
+        else:
+            limit = ThresholdConfig.parse_float(rule['limit'])
+        return None if limit is None else limit * rule['factor']
+
+    @staticmethod
+    def rule_metric(rule, values):
+        """规则比较的逐行指标：原值、相邻行变化量的绝对值或以该行结尾的窗口均值"""
+        if rule['type'] == 'rate':
+            metric = np.empty_like(values)
+            metric[:1] = np.nan
+            np.abs(np.diff(values), out=metric[1:])
+            return metric
+        if rule['type'] == 'rolling_mean':
+            return RollingStats.mean(values, rule['window'])
+        return values
+
+    @staticmethod
+    def find_runs(mask, metric, min_length=1):
+        """mask中连续为True且不短于min_length的区间[start, end]，以及区间内metric的最大值"""
+        # 前后各补一个0后求差分；全程用int8，避免列表拼接时整列升为int64
+        padded = np.zeros(len(mask) + 2, dtype=np.int8)
+        padded[1:-1] = mask
+        edges = np.diff(padded)
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+        keep = ends - starts + 1 >= min_length
+        starts, ends = starts[keep], ends[keep]
+        if len(starts) == 0:
+            return starts, ends, np.empty(0)
+        bounds = np.empty(len(starts) * 2, dtype=np.intp)
+        bounds[0::2], bounds[1::2] = starts, ends + 1
+        # 最后一个区间到数据末尾时去掉越界的下标，reduceat的最后一段本来就取到末尾
+        if bounds[-1] == len(metric):
+            bounds = bounds[:-1]
+        peaks = np.maximum.reduceat(metric, bounds)[0::2]
+        return starts, ends, peaks
+
+    @staticmethod
+    def rule_context(rule):
+        """计算某行的指标需要向前看的行数"""
+        if rule['type'] == 'rolling_mean':
+            return rule['window'] - 1
+        return 1 if rule['type'] == 'rate' else 0
+
+    def rule_runs(self, rule, limit, values, lo):
+        """从第lo行起的超限区间，lo之前的行只作为窗口上下文；同时返回第lo行是否超限"""
+        base = max(0, lo - self.rule_context(rule))
+        metric = self.rule_metric(rule, values[base:])[lo - base:]
+        with np.errstate(invalid='ignore'):
+            mask = metric > limit
+        min_length = rule['count'] if rule['type'] == 'consecutive' else 1
+        starts, ends, peaks = self.find_runs(mask, metric, min_length)
+        return starts + lo, ends + lo, peaks, bool(len(mask) and mask[0])
+
+    def evaluate(self, column, values, thresholds, start=0, previous=None):
+        """对一列执行所有适用的规则，返回该列的事件表；
+        传入追加前的事件表previous时只重算第start行附近及之后，之前已结束的事件原样保留"""
+        values = np.asarray(values, dtype='float64')
+        incremental = previous is not None and start > 0
+        results = []
+        for rule in self.rules:
+            if rule['columns'] is not None and column not in rule['columns']:
+                continue
+            limit = self.resolve_limit(rule, column, thresholds)
+            if limit is None:
+                continue
+            lo, margin = 0, 1
+            while True:
+                # 从追加处向前回退，直到回退点本身不超限，保证没有区间跨过回退点
+                if incremental:
+                    lo = max(0, start - margin)
+                starts, ends, peaks, open_run = self.rule_runs(rule, limit, values, lo)
+                if lo == 0 or not open_run:
+                    break
+                margin *= 2
+            results.append((rule['name'], lo, starts, ends, peaks))
+
+        frames = []
+        if incremental and results:
+            # 先按结束行整体保留各规则都不会再变化的事件，只有末尾少量事件需要按规则区分
+            previous_ends = previous['end'].to_numpy(dtype=np.int64)
+            final = previous_ends < min(lo for _, lo, _, _, _ in results)
+            frames.append(previous[final])
+            tail = previous[~final]
+            for name, lo, _, _, _ in results:
+                frames.append(tail[(tail['rule'] == name) & (tail['end'] < lo)])
+        for name, _, starts, ends, peaks in results:
+            if len(starts):
+                frames.append(pd.DataFrame({
+                    'rule': name, 'column': column,
+                    'start': starts, 'end': ends, 'peak': peaks}))
+        frames = [frame for frame in frames if len(frame)]
+        if not frames:
+            return pd.DataFrame(columns=self.EVENT_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+
+# ================== 跟踪模式的列缓冲 ==================
+class ColumnBuffers:
+    """跟踪模式下按列预留容量的数组，追加时写入空余位置，容量不足时按所需行数的两倍扩容；
+    DataFrame各列只是缓冲区前rows行的视图，追加新行不再复制整个表"""
+
+    def __init__(self, df):
+        self.columns = list(df.columns)
+        self.rows = len(df)
+        self.capacity = 0  # 第一次写入时才分配，在此之前各列引用df原有的数组，不能写入
+        self.arrays = []
+        for i in range(df.shape[1]):
+            series = df.iloc[:, i]
+            if isinstance(series.dtype, np.dtype):
+                self.arrays.append(series.to_numpy())
+            elif isinstance(series.dtype, pd.StringDtype):
+                # 字符串列改用object数组缓冲，追加时同样只写入新行
+                self.arrays.append(series.to_numpy(dtype=object))
+            else:
+                # category等扩展类型无法原地追加，仍按列合并
+                self.arrays.append(series.array)
+
+    def write(self, new_rows, start):
+        """从第start行起写入新行，start小于rows时覆盖末尾的行；返回各列为视图的DataFrame"""
+        rows = start + len(new_rows)
+        if rows > self.capacity:
+            self.capacity = 2 * rows
+            self.arrays = [self.reserve(arr, arr.dtype, start) if isinstance(arr, np.ndarray) else arr
+                           for arr in self.arrays]
+        for i, arr in enumerate(self.arrays):
+            series = new_rows.iloc[:, i]
+            if not isinstance(arr, np.ndarray):
+                self.arrays[i] = pd.concat([pd.Series(arr[:start]), series], ignore_index=True).array
+                continue
+            values = series.to_numpy()
+            if not np.can_cast(values.dtype, arr.dtype):
+                # 新行类型更宽（如整数列出现空值）时整列升级一次
+                arr = self.arrays[i] = self.reserve(arr, np.result_type(arr.dtype, values.dtype), start)
+            arr[start:rows] = values
+        self.rows = rows
+        return self.to_dataframe()
+
+    def reserve(self, arr, dtype, start):
+        """按当前容量分配新数组并复制前start行"""
+        new = np.empty(self.capacity, dtype=dtype)
+        new[:start] = arr[:start]
+        return new
+
+    def to_dataframe(self):
+        data = {}
+        for i, arr in enumerate(self.arrays):
+            values = arr[:self.rows]
+            if isinstance(values, np.ndarray) and values.dtype == object:
+                # 明确为object类型，否则会被推断为字符串类型并复制整列
+                values = pd.Series(values, dtype=object, copy=False)
+            data[i] = values
+        # copy=False保证各列仍是缓冲区的视图；先用序号作列名，允许重复的列名
+        df = pd.DataFrame(data, copy=False)
+        df.columns = self.columns
+        return df
+
+
+# ================== CSV 数据模型 ==================
+class CSVModelCore:
+    """不依赖Qt的数据模型：配置、加载、缓存、统计和报警判断，界面和命令行共用"""
+    CHUNK_SIZE = 100000  # 分块读取的行数
+    SOURCE_COLUMN = 'source_file'  # 合并多个文件时记录来源的列名
+    ROLLING_CACHE_SIZE = 16  # 最多缓存的滚动统计序列数
+    CANCEL_POLL_S = 0.2  # 并行解析时检查取消的间隔（秒）
+
+    def __init__(self, config_path='config.ini'):
+        self.config_path = config_path
+        self.df = pd.DataFrame()
+        self.stats = {}
+        self.pyramids = {}  # 列名 -> MinMaxPyramid，与stats一样按需构建并缓存
+        self.sketches = {}  # 列名 -> ColumnSketch，加载时逐块构建，用于分位数和分布直方图
+        self.exceedance_indexes = {}  # 列名 -> ExceedanceIndex，拖动预期最大值线时使用
+        self.rolling_cache = OrderedDict()  # (列名, 窗口, 统计量) -> 滚动统计序列的MinMaxPyramid
+        self.apply_config(self.load_config())
+        self.config_mtime = self.get_config_mtime()
+        self.selected_columns = []
+        self.alarm_history = self.create_alarm_history()
+        self.config_dirty = False  # 内存中的配置有未写回文件的修改
+        self.cache = self.create_cache()
+        self.store_cache = self.create_store_cache()
+        self.column_store = None
+        self.cache_entry = None
+        self.memory_report = None
+        self.buffers = None  # 跟踪模式追加行时创建的ColumnBuffers
+
+    def load_config(self):
+        config = configparser.ConfigParser()
+        config['EXPECTED_MAX'] = {
+            'enabled': 'True',
+            'default_value': '100',
+            'color': '#00FF00',
+            'width': '2',
+            'style': 'dash',
+            'alarm_threshold': '1.05'
+        }
+        config['COLUMN_SPECIFIC'] = {}
+        config['CACHE'] = {
+            'enabled': 'True',
+            'directory': '.csv_cache',
+            'max_size_mb': '2048'
+        }
+        config['LOAD'] = {
+            'mmap_threshold_mb': '1024',
+            'compact_dtypes': 'False',
+            'category_max_ratio': '0.5',
+            'follow_interval_ms': '1000',
+            'workers': '0'
+        }
+        config['OVERLAY'] = {
+            'batch_columns': '10',
+            'normalize': 'False'
+        }
+        config['ALARM_HISTORY'] = {
+            'enabled': 'True',
+            'path': 'alarm_history.db',
+            'capacity': '1000',
+            'flush_size': '50'
+        }
+        # 报警规则：type为threshold/rate/rolling_mean/consecutive
+        config['RULE threshold'] = {
+            'enabled': 'True',
+            'type': 'threshold',
+            'columns': '*',
+            'limit': 'expected',
+            'factor': '1.0'
+        }
+        config['RULE consecutive'] = {
+            'enabled': 'True',
+            'type': 'consecutive',
+            'columns': '*',
+            'limit': 'expected',
+            'factor': '1.0',
+            'count': '5'
+        }
+        config['RULE rolling_mean'] = {
+            'enabled': 'False',
+            'type': 'rolling_mean',
+            'columns': '*',
+            'limit': 'expected',
+            'factor': '0.9',
+            'window': '100'
+        }
+        config['RULE rate'] = {
+            'enabled': 'False',
+            'type': 'rate',
+            'columns': '*',
+            'limit': '10',
+            'factor': '1.0'
+        }
+
+        if os.path.exists(self.config_path):
+            config.read(self.config_path)
+        else:
+            with open(self.config_path, 'w') as configfile:
+                config.write(configfile)
+
+        return config
+
+    def apply_config(self, config):
+        """由配置生成阈值缓存和报警规则，加载和重新加载配置时调用；
+        全部生成成功后才替换，配置有误时抛出configparser.Error或ValueError，原有状态不变"""
+        thresholds = ThresholdConfig(config)
+        alarm_engine = AlarmEngine.from_config(config)
+        compact_dtypes = config.getboolean('LOAD', 'compact_dtypes', fallback=False)
+        self.config = config
+        self.thresholds = thresholds
+        self.alarm_engine = alarm_engine
+        self.alarm_events = {}  # 列名 -> 报警规则事件表，按需计算并缓存
+        # 界面上的开关只修改该属性，不写入配置，重新加载配置时以文件为准
+        self.compact_dtypes = compact_dtypes
+
+    def create_cache(self):
+        if not self.config.getboolean('CACHE', 'enabled', fallback=True):
+            return None
+        return CSVCache(
+            cache_dir=self.config.get('CACHE', 'directory', fallback='.csv_cache'),
+            max_size_mb=self.config.getfloat('CACHE', 'max_size_mb', fallback=2048)
+        )
+
+    def create_store_cache(self, directory=None):
+        """内存映射存储所在的缓存：默认与解析缓存共用；未启用缓存时放在系统临时目录，
+        同样按内容哈希区分并按容量淘汰，不在数据文件旁边留下转换结果"""
+        if directory is None and self.cache:
+            return self.cache
+        return CSVCache(
+            cache_dir=directory or os.path.join(tempfile.gettempdir(), 'csv_mmap'),
+            max_size_mb=self.config.getfloat('CACHE', 'max_size_mb', fallback=2048)
+        )
+
+    def create_alarm_history(self):
+        """未启用持久化时只在内存中保留最近的记录"""
+        enabled = self.config.getboolean('ALARM_HISTORY', 'enabled', fallback=True)
+        return AlarmHistory(
+            path=self.config.get('ALARM_HISTORY', 'path', fallback='alarm_history.db') if enabled else None,
+            capacity=self.config.getint('ALARM_HISTORY', 'capacity', fallback=1000),
+            flush_size=self.config.getint('ALARM_HISTORY', 'flush_size', fallback=50)
+        )
+
+    def get_max_line_value(self, column_name):
+        """预期最大值线的位置，未启用或未配置时返回None"""
+        if not self.thresholds.enabled:
+            return None
+        return self.get_expected_max(column_name)
+
+    def update_expected_max(self, column_name, new_value):
+        """只修改内存中的配置，由视图模型防抖后调用serialize_config写回文件"""
+        if 'COLUMN_SPECIFIC' not in self.config:
+            self.config['COLUMN_SPECIFIC'] = {}
+        self.config['COLUMN_SPECIFIC'][column_name] = str(new_value)
+        self.thresholds.set(column_name, new_value)
+        self.alarm_events.pop(column_name, None)
+        self.config_dirty = True
+
+    def get_config_mtime(self):
+        try:
+            return os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload_config_if_changed(self):
+        """配置文件修改时间变化时重新加载，返回是否重新加载；有未写回的修改时暂不加载。
+        配置有误时抛出configparser.Error或ValueError，继续使用原配置"""
+        mtime = self.get_config_mtime()
+        if mtime == self.config_mtime or self.config_dirty:
+            return False
+        # 先记录修改时间，有误的文件在再次修改前不会每次轮询都重新解析
+        self.config_mtime = mtime
+        self.apply_config(self.load_config())
+        self.config_mtime = self.get_config_mtime()
+        return True
+
+    def serialize_config(self):
+        """取出待写入的配置文本并清除修改标记"""
+        buffer = io.StringIO()
+        self.config.write(buffer)
+        self.config_dirty = False
+        return buffer.getvalue()
+
+    @staticmethod
+    def write_config_file(path, text):
+        """先写同目录下的临时文件再原子替换，写入中断时原文件保持完整"""
+        directory = os.path.dirname(os.path.abspath(path))
+        tmp_path = os.path.join(directory, f'.{os.path.basename(path)}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'w') as configfile:
+                configfile.write(text)
+                configfile.flush()
+                os.fsync(configfile.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def iter_csv_chunks(self, file_path, encoding=None, progress_callback=None, source_info=None):
+        """逐块读取CSV，并按已读取的字节数回报进度；source_info用于带回编码和读取到的字节位置"""
+        encoding = encoding or detect_encoding(file_path)
+        # 抽样未覆盖到的个别错误字节在解码时就地处理，不再从头重读
+        errors = 'gbk_fallback' if encoding.startswith('utf-8') else 'replace'
+        file_size = os.path.getsize(file_path) or 1
+        with open(file_path, 'rb') as f, \
+                pd.read_csv(f, encoding=encoding, encoding_errors=errors,
+                            chunksize=self.CHUNK_SIZE) as reader:
+            # 晚一块交出，读到末尾时才能处理最后一块
+            previous = last = None
+            for chunk in reader:
+                if last is not None:
+                    yield self.clean_columns(last)
+                previous, last = last, chunk
+                if progress_callback:
+                    progress_callback(min(99, int(f.tell() * 100 / file_size)))
+            offset = f.tell()
+            # 文件末尾没有换行时保留最后一行，但读取位置记在该行之前并标记为临时行：
+            # 文件可能正在写入，跟踪模式从该位置重新读取，用读到的完整行替换它
+            end = self.complete_lines_end(f, offset)
+            provisional = False
+            if last is not None and len(last) and end < offset:
+                f.seek(end)
+                provisional = bool(f.read(offset - end).strip())
+                offset = end
+                if provisional:
+                    last = self.coerce_provisional_row(last, previous)
+            if last is not None:
+                yield self.clean_columns(last)
+            if source_info is not None:
+                source_info.update({'source_path': os.path.abspath(file_path),
+                                    'source_encoding': encoding,
+                                    'source_offset': offset,
+                                    'source_provisional': provisional})
+
+    @staticmethod
+    def coerce_provisional_row(chunk, previous=None):
+        """未写完的最后一行可能只有“-”“1e”之类的片段，会使整列被推断为字符串；
+        其余行都是数值的列仍按数值解析，片段记为NaN，之后由跟踪模式替换"""
+        body = chunk.iloc[:-1]
+        for col in chunk.columns:
+            if pd.api.types.is_numeric_dtype(chunk[col]):
+                continue
+            if len(body):
+                numeric = pd.to_numeric(body[col], errors='coerce').isna().sum() == body[col].isna().sum()
+            else:
+                numeric = previous is not None and col in previous.columns \
+                          and pd.api.types.is_numeric_dtype(previous[col])
+            if numeric:
+                chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+        return chunk
+
+    @staticmethod
+    def complete_lines_end(f, offset, block=65536):
+        """offset之前最后一个换行符之后的位置，即最后一个完整行的结尾"""
+        pos = offset
+        while pos > 0:
+            start = max(0, pos - block)
+            f.seek(start)
+            i = f.read(pos - start).rfind(b'\n')
+            if i >= 0:
+                return start + i + 1
+            pos = start
+        return 0
+
+    def read_csv_chunks(self, file_path, progress_callback=None, is_cancelled=None, sketches=None):
+        """分块读取CSV，可在后台线程调用；传入sketches时逐块更新各列的分布草图；取消时返回None"""
+        chunks = []
+        source_info = {}
+        for chunk in self.iter_csv_chunks(file_path, progress_callback=progress_callback,
+                                          source_info=source_info):
+            if is_cancelled and is_cancelled():
+                return None
+            chunks.append(chunk)
+            if sketches is not None:
+                ColumnSketch.update_columns(sketches, chunk)
+
+        if progress_callback:
+            progress_callback(100)
+        df = pd.concat(chunks, ignore_index=True)
+        # 记录读取位置，跟踪模式下只读取之后追加的内容
+        df.attrs.update(source_info)
+        return df
+
+    def build_column_store(self, file_path, progress_callback=None, is_cancelled=None):
+        """将大文件的数值列转换为内存映射存储；取消时返回None"""
+        store_dir = self.store_cache.entry_path(file_path) + '_mmap'
+        source = ColumnStore.source_signature(file_path)
+        store = ColumnStore(store_dir)
+        if not store.is_complete(source):
+            chunks = self.iter_csv_chunks(file_path, progress_callback=progress_callback)
+            if not store.convert(chunks, is_cancelled, source):
+                return None
+            self.store_cache.evict(keep=os.path.basename(store_dir))
+
+        store.open()
+        if progress_callback:
+            progress_callback(100)
+        return store
+
+    @staticmethod
+    def is_float32_safe(values):
+        """按数据的小数位数判断float32的舍入误差是否会改变原始数值"""
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return True
+        if np.abs(values).max() > np.finfo('float32').max:
+            return False
+        error = np.abs(values.astype('float32').astype('float64') - values).max()
+        for decimals in range(7):
+            if np.allclose(np.round(values, decimals), values, rtol=0, atol=1e-9):
+                return error < 0.5 * 10 ** -decimals
+        return False
+
+    @staticmethod
+    def compact_dataframe(df, category_max_ratio=0.5):
+        """数值列降为最小的安全类型，低基数字符串列转为category，记录前后内存占用"""
+        before = int(df.memory_usage(deep=True).sum())
+        for col in df.columns:
+            series = df[col]
+            if pd.api.types.is_bool_dtype(series):
+                continue
+            if pd.api.types.is_integer_dtype(series):
+                downcast = 'unsigned' if len(series) and series.min() >= 0 else 'integer'
+                df[col] = pd.to_numeric(series, downcast=downcast)
+            elif pd.api.types.is_float_dtype(series):
+                if CSVModelCore.is_float32_safe(series.values):
+                    df[col] = series.astype('float32')
+            elif (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)) \
+                    and len(series):
+                if series.nunique(dropna=True) <= len(series) * category_max_ratio:
+                    df[col] = series.astype('category')
+        after = int(df.memory_usage(deep=True).sum())
+        df.attrs['memory_report'] = {'before': before, 'after': after}
+        return df
+
+    @staticmethod
+    def clean_columns(df):
+        # 清洗列名（移除空格和特殊字符）
+        df.columns = [str(col).strip().replace(' ', '_') for col in df.columns]
+        return df
+
+    @staticmethod
+    def expand_sources(path):
+        """把目录或通配符展开为按名称排序的CSV文件列表"""
+        if os.path.isdir(path):
+            return sorted(glob.glob(os.path.join(path, '*.csv')))
+        if glob.has_magic(path):
+            return sorted(p for p in glob.glob(path, recursive=True) if os.path.isfile(p))
+        return [path]
+
+    @staticmethod
+    def parse_csv_file(file_path):
+        """在子进程中解析单个CSV，同时返回各列分布草图的状态，由主进程合并"""
+        encoding = detect_encoding(file_path)
+        errors = 'gbk_fallback' if encoding.startswith('utf-8') else 'replace'
+        df = CSVModelCore.clean_columns(pd.read_csv(file_path, encoding=encoding, encoding_errors=errors))
+        return df, ColumnSketch.to_states(ColumnSketch.update_columns({}, df))
+
+    def prepare_dataset(self, file_paths, progress_callback=None, is_cancelled=None):
+        """用进程池并行解析多个CSV，按文件顺序对齐列后合并；取消时返回None"""
+        workers = self.config.getint('LOAD', 'workers', fallback=0) or os.cpu_count()
+        frames = [None] * len(file_paths)
+        states = [None] * len(file_paths)
+        # 在带Qt线程的进程中fork不安全，统一用spawn启动子进程
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(file_paths)),
+                                       mp_context=multiprocessing.get_context('spawn'))
+        pending = set()
+        try:
+            futures = {executor.submit(CSVModelCore.parse_csv_file, path): i
+                       for i, path in enumerate(file_paths)}
+            pending = set(futures)
+            while pending:
+                # 定时醒来检查取消，不必等正在解析的大文件完成
+                finished, pending = wait(pending, timeout=self.CANCEL_POLL_S,
+                                         return_when=FIRST_COMPLETED)
+                if is_cancelled and is_cancelled():
+                    return None
+                for future in finished:
+                    frames[futures[future]], states[futures[future]] = future.result()
+                if finished and progress_callback:
+                    done = len(futures) - len(pending)
+                    progress_callback(min(99, done * 100 // len(file_paths)))
+        finally:
+            # 取消或出错时不等待仍在运行的子进程，其结果直接丢弃
+            executor.shutdown(wait=not pending, cancel_futures=True)
+
+        # 列按出现顺序取并集，缺失的列补NaN
+        df = pd.concat(frames, ignore_index=True, sort=False)
+        sketches = {}
+        for file_states in states:
+            ColumnSketch.merge_states(sketches, file_states)
+        common = os.path.commonpath([os.path.abspath(p) for p in file_paths])
+        if len(file_paths) == 1:
+            common = os.path.dirname(common)
+        names = [os.path.relpath(os.path.abspath(p), common) for p in file_paths]
+        codes = np.repeat(np.arange(len(frames)), [len(frame) for frame in frames])
+        df.insert(0, self.SOURCE_COLUMN, pd.Categorical.from_codes(codes, categories=names))
+
+        if self.compact_dtypes:
+            df = self.compact_dataframe(
+                df, self.config.getfloat('LOAD', 'category_max_ratio', fallback=0.5))
+        if progress_callback:
+            progress_callback(100)
+        return df, {}, None, sketches
+
+    def prepare_data(self, file_path, progress_callback=None, is_cancelled=None):
+        """读取CSV并计算统计信息，优先使用缓存；取消时返回None"""
+        if os.path.isdir(file_path) or glob.has_magic(file_path):
+            # 目录或通配符：多个文件并行解析后合并为一个数据集
+            file_paths = self.expand_sources(file_path)
+            if not file_paths:
+                raise ValueError(f"未找到CSV文件: {file_path}")
+            return self.prepare_dataset(file_paths, progress_callback, is_cancelled)
+
+        threshold_mb = self.config.getfloat('LOAD', 'mmap_threshold_mb', fallback=1024)
+        if os.path.getsize(file_path) >= threshold_mb * 1024 * 1024:
+            # 超大文件只保留数值列，以内存映射方式按需读取
+            store = self.build_column_store(file_path, progress_callback, is_cancelled)
+            if store is None:
+                return None
+            return store.to_dataframe(), store.load_stats(), store, store.load_sketches()
+
+        compact = self.compact_dtypes
+        variant = 'compact' if compact else ''
+        if self.cache:
+            cached = self.cache.load(file_path, variant)
+            if cached is not None:
+                if progress_callback:
+                    progress_callback(100)
+                df, stats, sketches = cached
+                return df, stats, None, sketches
+
+        sketches = {}
+        df = self.read_csv_chunks(file_path, progress_callback, is_cancelled, sketches)
+        if df is None:
+            return None
+        df = self.clean_columns(df)
+        if compact:
+            df = self.compact_dataframe(
+                df, self.config.getfloat('LOAD', 'category_max_ratio', fallback=0.5))
+        # 统计信息改为首次查看某列时再计算
+        stats = {}
+        if self.cache:
+            self.cache.save(file_path, df, stats, variant, sketches)
+        return df, stats, None, sketches
+
+    def set_dataframe(self, df, stats=None, column_store=None, sketches=None):
+        """接收加载完成的DataFrame、统计信息和分布草图"""
+        self.df = self.clean_columns(df)
+        self.column_store = column_store
+        self.memory_report = df.attrs.get('memory_report')
+        self.cache_entry = df.attrs.get('cache_entry')
+        # 已缓存的列统计直接复用，其余列按需计算
+        self.stats = dict(stats) if stats else {}
+        self.sketches = dict(sketches) if sketches else {}
+        self.buffers = None
+        self.reset_column_caches()
+
+    def is_numeric_column(self, column):
+        if self.column_store:
+            return column in self.column_store.arrays
+        return column in self.df.columns and pd.api.types.is_numeric_dtype(self.df[column])
+
+    def get_stats(self, column):
+        """懒计算单列统计信息，结果按列缓存，设置新数据时清除，追加行时增量合并"""
+        if column in self.stats:
+            return self.stats[column]
+        if not self.is_numeric_column(column):
+            return None
+        if self.column_store:
+            col_stats = self.column_store.compute_stats([column])[column]
+        else:
+            col_stats = self.compute_stats(self.df[[column]])[column]
+        self.stats[column] = col_stats
+        self.persist_stats()
+        return col_stats
+
+    def reset_column_caches(self):
+        """设置新数据时清除按列构建的金字塔、超限索引、滚动统计和报警事件；
+        新增按列缓存时在这里登记，并在append_rows中增量更新或清除"""
+        self.pyramids = {}
+        self.exceedance_indexes = {}
+        self.rolling_cache.clear()
+        self.alarm_events = {}
+
+    def get_pyramid(self, column):
+        """单列只构建一次最小/最大值金字塔，单列、多列和叠加视图共用"""
+        if column not in self.pyramids:
+            if not self.is_numeric_column(column):
+                return None
+            self.pyramids[column] = MinMaxPyramid(self.get_plot_data(column))
+        return self.pyramids[column]
+
+    def get_sketch(self, column):
+        """加载时未能构建草图的列（旧缓存或混有非数值内容）按块扫描整列补建一次"""
+        sketch = self.sketches.get(column)
+        if sketch is None:
+            if not self.is_numeric_column(column):
+                return None
+            sketch = ColumnSketch()
+            values = self.get_plot_data(column)
+            for start in range(0, len(values), self.CHUNK_SIZE):
+                sketch.update(values[start:start + self.CHUNK_SIZE])
+            self.sketches[column] = sketch
+            self.persist_sketches()
+        return sketch
+
+    def get_exceedance_index(self, column):
+        if column not in self.exceedance_indexes:
+            if not self.is_numeric_column(column):
+                return None
+            if self.column_store:
+                # 内存映射模式下索引同样写入存储目录，不在内存中保留整列排序结果
+                self.exceedance_indexes[column] = self.column_store.exceedance_index(column)
+            else:
+                self.exceedance_indexes[column] = ExceedanceIndex(self.get_plot_data(column))
+        return self.exceedance_indexes[column]
+
+    def get_rolling_pyramid(self, column, window, statistic):
+        """滚动统计序列按(列, 窗口, 统计量)缓存，单列、多列和叠加视图共用"""
+        key = (column, window, statistic)
+        if key in self.rolling_cache:
+            self.rolling_cache.move_to_end(key)
+            return self.rolling_cache[key]
+        if not self.is_numeric_column(column):
+            return None
+        values = RollingStats.compute(statistic, self.get_plot_data(column), window)
+        self.rolling_cache[key] = MinMaxPyramid(values)
+        if len(self.rolling_cache) > self.ROLLING_CACHE_SIZE:
+            self.rolling_cache.popitem(last=False)
+        return self.rolling_cache[key]
+
+    def get_alarm_events(self, columns=None):
+        """所有数值列（或指定列）的报警规则事件表，未缓存的列在一次调用中逐列向量化计算"""
+        if columns is None:
+            columns = [col for col in self.df.columns if self.is_numeric_column(col)]
+        frames = []
+        for column in columns:
+            if column not in self.alarm_events:
+                if not self.is_numeric_column(column):
+                    continue
+                self.alarm_events[column] = self.alarm_engine.evaluate(
+                    column, self.get_plot_data(column), self.thresholds)
+            frames.append(self.alarm_events[column])
+        frames = [frame for frame in frames if len(frame)]
+        if not frames:
+            return pd.DataFrame(columns=AlarmEngine.EVENT_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    def persist_stats(self):
+        """把已计算的统计信息写回缓存，下次打开同一文件时无需重算"""
+        if self.column_store:
+            self.column_store.save_stats(self.stats)
+        elif self.cache and self.cache_entry:
+            self.cache.save_stats(self.cache_entry, self.stats)
+
+    def persist_sketches(self):
+        if self.column_store:
+            self.column_store.save_sketches(self.sketches)
+        elif self.cache and self.cache_entry:
+            self.cache.save_sketches(self.cache_entry, self.sketches)
+
+    def calculate_stats(self):
+        if self.column_store:
+            self.stats = self.column_store.compute_stats()
+        else:
+            self.stats = self.compute_stats(self.df)
+        self.persist_stats()
+
+    @staticmethod
+    def compute_stats(df):
+        """对全部数值列做一次向量化聚合，最值所在行只记录行号"""
+        mins = df.min(numeric_only=True)
+        if mins.empty:
+            return {}
+        maxs = df.max(numeric_only=True)
+        means = df.mean(numeric_only=True)
+        counts = df.count()
+        columns = mins.index
+        if (counts[columns] > 0).all():
+            argmins = df.idxmin(numeric_only=True)
+            argmaxs = df.idxmax(numeric_only=True)
+        else:
+            # 全为NaN的列没有最值位置，逐列处理
+            argmins = pd.Series({col: df[col].idxmin() if counts[col] else -1 for col in columns})
+            argmaxs = pd.Series({col: df[col].idxmax() if counts[col] else -1 for col in columns})
+
+        stats = {}
+        for col in columns:
+            stats[col] = {
+                'min': mins[col],
+                'max': maxs[col],
+                'mean': means[col],
+                'count': int(counts[col]),
+                'nan_count': len(df) - int(counts[col]),
+                'argmin': int(argmins[col]),
+                'argmax': int(argmaxs[col])
+            }
+        return stats
+
+    def get_plot_data(self, column):
+        # 内存映射模式下直接返回memmap，只有被访问的页才会读入内存
+        if self.column_store and column in self.column_store.arrays:
+            return self.column_store.arrays[column]
+        if column not in self.df.columns:
+            return []
+        values = self.df[column].values
+        # 压缩加载后的小整数类型转为float32，避免绘图计算范围时溢出
+        if values.dtype.kind in 'iu' and values.dtype.itemsize < 4:
+            values = values.astype('float32')
+        return values
+
+    def set_selected_columns(self, columns):
+        self.selected_columns = columns
+
+    def can_follow(self):
+        """内存映射模式和缓存前的旧数据没有读取位置，不支持跟踪"""
+        return self.column_store is None and 'source_offset' in self.df.attrs
+
+    def read_appended_rows(self):
+        """只读取文件新追加的完整行；文件被截断或重写时抛出ValueError"""
+        attrs = self.df.attrs
+        offset = attrs['source_offset']
+        size = os.path.getsize(attrs['source_path'])
+        if size < offset:
+            raise ValueError("文件已被截断或重写，请重新打开")
+        if size == offset:
+            return None
+        with open(attrs['source_path'], 'rb') as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        # 最后一行可能尚未写完，留到下次读取
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return None
+        new_rows = pd.read_csv(io.BytesIO(data[:end]), header=None, names=self.df.columns,
+                               encoding=attrs['source_encoding'], encoding_errors='replace')
+        attrs['source_offset'] = offset + end
+        return new_rows
+
+    def append_rows(self, new_rows):
+        """追加新行并增量更新已计算的列统计，返回新行的起始行号；
+        末尾有临时行时新行从它的位置写入，第一行即重新读取的该行"""
+        start = len(self.df)
+        attrs = dict(self.df.attrs)
+        if attrs.pop('source_provisional', False) and start:
+            start -= 1
+            self.remove_last_row()
+        # 写入预留容量的列缓冲，不复制已有的行
+        if self.buffers is None:
+            self.buffers = ColumnBuffers(self.df)
+        self.df = self.buffers.write(new_rows, start)
+        self.df.attrs.update(attrs)
+        # 缓存中保存的是追加前的数据，之后的统计不再写回
+        self.cache_entry = None
+        for col, col_stats in self.stats.items():
+            self.stats[col] = self.merge_stats(col_stats, new_rows[col], start)
+        # 草图可直接合并新数据
+        for col, sketch in self.sketches.items():
+            if sketch is not None and col in new_rows.columns:
+                sketch.update(pd.to_numeric(new_rows[col], errors='coerce').to_numpy(
+                    dtype='float64', na_value=np.nan))
+        # 金字塔、超限索引和报警事件只就追加的行增量更新，不重扫整列
+        for col, pyramid in self.pyramids.items():
+            pyramid.extend(self.get_plot_data(col), start)
+        for col, index in self.exceedance_indexes.items():
+            index.extend(self.get_plot_data(col)[start:], start)
+        for col, events in self.alarm_events.items():
+            self.alarm_events[col] = self.alarm_engine.evaluate(
+                col, self.get_plot_data(col), self.thresholds, start=start, previous=events)
+        # 滚动统计只在显示时按需重算
+        self.rolling_cache.clear()
+        return start
+
+    def remove_last_row(self):
+        """从统计和草图中去掉即将被替换的最后一行；它是最值所在行时该列统计改为按需重算，
+        草图无法去掉单个值，整列重建一次"""
+        row = len(self.df) - 1
+        for col, col_stats in list(self.stats.items()):
+            value = pd.to_numeric(self.df[col].iloc[row:], errors='coerce').to_numpy(
+                dtype='float64', na_value=np.nan)[0]
+            if row in (col_stats['argmin'], col_stats['argmax']):
+                del self.stats[col]
+            elif np.isnan(value):
+                self.stats[col] = dict(col_stats, nan_count=col_stats['nan_count'] - 1)
+            else:
+                count = col_stats['count'] - 1
+                self.stats[col] = dict(col_stats, count=count,
+                                       mean=(col_stats['mean'] * col_stats['count'] - value) / count)
+        self.sketches = {}
+
+    @staticmethod
+    def merge_stats(col_stats, values, start):
+        """将新数据的统计合并到已有统计中，无需重新扫描全部数据"""
+        arr = pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        valid = ~np.isnan(arr)
+        count = int(valid.sum())
+        merged = dict(col_stats)
+        merged['nan_count'] = col_stats['nan_count'] + len(arr) - count
+        if count == 0:
+            return merged
+
+        old_count = col_stats['count']
+        merged['count'] = old_count + count
+        merged['mean'] = (col_stats['mean'] * old_count + arr[valid].sum()) / merged['count'] \
+            if old_count else arr[valid].mean()
+        i, j = np.nanargmin(arr), np.nanargmax(arr)
+        if old_count == 0 or arr[i] < col_stats['min']:
+            merged['min'], merged['argmin'] = arr[i], start + int(i)
+        if old_count == 0 or arr[j] > col_stats['max']:
+            merged['max'], merged['argmax'] = arr[j], start + int(j)
+        return merged
+
+    def get_expected_max(self, column_name):
+        """获取指定列的预期最大值"""
+        return self.thresholds.get(column_name)
+
+    def get_alarm_threshold(self, column_name):
+        """报警阈值 = 预期最大值 × alarm_threshold，未配置时返回None"""
+        expected_max = self.get_expected_max(column_name)
+        if expected_max is None:
+            return None
+        return expected_max * self.thresholds.alarm_threshold
+
+    def is_max_value_alarm(self, column_name, max_value):
+        """只判断是否超过报警阈值，不记录报警历史，拖动预期最大值线时使用"""
+        threshold_value = self.get_alarm_threshold(column_name)
+        return threshold_value is not None and bool(max_value > threshold_value)
+
+    def check_max_value_alarm(self, column_name, max_value):
+        """检查最大值是否超过预期并触发报警"""
+        if self.is_max_value_alarm(column_name, max_value):
+            # 记录报警历史，重复绘制同一列时不会重复记录
+            threshold_value = self.get_alarm_threshold(column_name)
+            alarm_msg = f"{column_name}最大值{max_value:.2f}超过报警阈值{threshold_value:.2f}"
+            self.alarm_history.record(column_name, threshold_value, max_value, alarm_msg,
+                                      source=self.df.attrs.get('source_path', ''))
+            return True
+        return False
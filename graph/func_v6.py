@@ -8,22 +8,26 @@
 """
 import sys
 import os
+import subprocess
 import configparser
-import pandas as pd
+from collections import OrderedDict
 import numpy as np
 import pyqtgraph as pg
-from PyQt5.QtCore import Qt, QAbstractTableModel
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QThread, QTimer, pyqtSignal
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
     QFileDialog, QLabel, QComboBox, QSplitter, QTextEdit, QHeaderView, QMessageBox,
     QTableView, QListWidget, QListWidgetItem, QDialog, QDialogButtonBox, QGroupBox,
-    QScrollArea, QGridLayout, QCheckBox
+    QScrollArea, QCheckBox, QProgressDialog, QLineEdit, QSpinBox
 )
+from csv_core import CSVModelCore, RollingStats, ThresholdConfig
 
 
 # ================== 可拖动的预期最大值线 ==================
 class DraggableMaxLine(pg.InfiniteLine):
-    sigPositionChanged = pg.QtCore.Signal(float)
+    # 只在用户拖动时发出；不能覆盖基类的sigPositionChanged，setPos会以线对象本身发出该信号
+    sigValueDragged = pg.QtCore.Signal(float)
+    sigDragFinished = pg.QtCore.Signal()
 
     def __init__(self, pos, angle=0, **kwargs):
         super().__init__(pos=pos, angle=angle, **kwargs)
@@ -44,210 +48,527 @@ class DraggableMaxLine(pg.InfiniteLine):
             view_range = self.getViewBox().viewRange()[1]
             new_y = max(view_range[0], min(view_range[1], new_y))
             self.setPos(new_y)
-            self.sigPositionChanged.emit(new_y)
+            self.sigValueDragged.emit(new_y)
             event.accept()
 
     def mouseReleaseEvent(self, event):
-        self.dragging = False
+        if self.dragging:
+            self.dragging = False
+            self.sigDragFinished.emit()
         event.accept()
 
 
+# ================== 曲线抽稀 ==================
+class DecimatedPlot:
+    """视图范围感知的曲线抽稀：缩放或平移时从金字塔取每个像素列的最小/最大值包络"""
+    RAW_POINTS = 2000  # 可见点数不超过该值时直接画原始点
+    MIN_PIXELS = 200  # 视图尚未布局时按该宽度分段
+
+    def __init__(self, plot_widget, curve, pyramid, line=None, alarm_item=None, symbol='o'):
+        self.view_box = plot_widget.getViewBox()
+        self.curve = curve
+        self.pyramid = pyramid
+        self.line = line
+        self.alarm_item = alarm_item
+        self.symbol = symbol
+        self._updating = False
+        self._alarm_points = None  # 最近一次绘制中可能超限的(x, y)，拖动线时只需重新比较
+        self.view_box.sigXRangeChanged.connect(self.update)
+        self.view_box.sigResized.connect(self.update)
+        self.update()
+
+    def detach(self):
+        self.view_box.sigXRangeChanged.disconnect(self.update)
+        self.view_box.sigResized.disconnect(self.update)
+
+    def set_pyramid(self, pyramid):
+        self.pyramid = pyramid
+        if pyramid is None or len(pyramid.data) == 0:
+            self._alarm_points = None
+            self.curve.clear()
+            if self.alarm_item is not None:
+                self.alarm_item.clear()
+            return
+        self.update()
+
+    def update(self, *args):
+        # setData会触发自动缩放并再次发出范围变化信号，避免重入
+        if self._updating or self.pyramid is None or len(self.pyramid.data) == 0:
+            return
+        self._updating = True
+        try:
+            self.redraw()
+        finally:
+            self._updating = False
+
+    @classmethod
+    def visible_span(cls, view_box, n):
+        """视图中可见的行范围[start, stop)和像素宽度"""
+        if view_box.autoRangeEnabled()[0]:
+            # 自动缩放时画整列，否则可见范围和数据范围会互相收缩
+            x0, x1 = 0, n
+        else:
+            x0, x1 = view_box.viewRange()[0]
+        start = min(max(0, int(np.floor(x0))), n - 1)
+        stop = max(min(n, int(np.ceil(x1)) + 1), start + 1)
+        pixels = max(cls.MIN_PIXELS, int(view_box.width()))
+        return start, stop, pixels
+
+    def redraw(self):
+        data = self.pyramid.data
+        start, stop, pixels = self.visible_span(self.view_box, len(data))
+
+        if stop - start <= max(self.RAW_POINTS, pixels * 2):
+            x = np.arange(start, stop)
+            y = np.asarray(data[start:stop], dtype='float64')
+            self.curve.setSymbol(self.symbol)
+            self.curve.setData(x, y)
+            self._alarm_points = (x, y)
+            self.update_alarms()
+            return
+
+        x, y, peak_x, peak_y = self.pyramid.envelope(start, stop, pixels)
+        # 补上两端的点，保证自动缩放时数据范围与可见范围一致
+        x = np.concatenate([[start], x, [stop - 1]])
+        y = np.concatenate([[data[start]], y, [data[stop - 1]]])
+        self.curve.setSymbol(None)
+        self.curve.setData(x, y, connect='finite')
+        # 每个像素列只标记一个超限峰值，任何缩放级别下都能看到
+        self._alarm_points = (peak_x, peak_y)
+        self.update_alarms()
+
+    def update_alarms(self):
+        """按预期最大值线的当前位置重新标记超限点，点数不超过可见的像素列数"""
+        if self.alarm_item is None or self.line is None or self._alarm_points is None:
+            return
+        x, y = self._alarm_points
+        mask = y > self.line.value()
+        self.alarm_item.setData(x[mask], y[mask])
+
+
+class BatchedOverlay:
+    """高密度叠加：同一颜色的所有列抽稀后以NaN隔开拼成一条路径，场景中只有颜色数条曲线"""
+    MAX_POINTS = 100000  # 所有曲线合计的绘制点数上限
+    MIN_PIXELS = 64  # 每列至少保留的分段数
+
+    def __init__(self, plot_widget, colors):
+        self.view_box = plot_widget.getViewBox()
+        self.curves = [plot_widget.plot(pen=pg.mkPen(color, width=1)) for color in colors]
+        self.groups = [[] for _ in colors]  # 每种颜色的(金字塔, 偏移, 缩放)
+        self._updating = False
+        self.view_box.sigXRangeChanged.connect(self.update)
+        self.view_box.sigResized.connect(self.update)
+
+    def set_columns(self, pyramids, normalize=False):
+        """按顺序给列分配颜色，normalize时每列缩放到[0, 1]"""
+        groups = [[] for _ in self.curves]
+        for i, pyramid in enumerate(pyramids):
+            offset, scale = 0.0, 1.0
+            if normalize:
+                low, high = pyramid.value_range()
+                if np.isfinite(low):
+                    offset = low
+                    scale = high - low if high > low else 1.0
+            groups[i % len(groups)].append((pyramid, offset, scale))
+        self.groups = groups
+        for curve in self.curves:
+            curve.show()
+        self.update()
+
+    def clear(self):
+        self.groups = [[] for _ in self.curves]
+        for curve in self.curves:
+            curve.clear()
+            curve.hide()
+
+    def update(self, *args):
+        if self._updating or not any(self.groups):
+            return
+        self._updating = True
+        try:
+            self.redraw()
+        finally:
+            self._updating = False
+
+    def redraw(self):
+        n = max(len(pyramid.data) for group in self.groups for pyramid, _, _ in group)
+        start, stop, pixels = DecimatedPlot.visible_span(self.view_box, n)
+        # 绘制耗时与总点数成正比，列数多时降低每列的分辨率
+        columns = sum(len(group) for group in self.groups)
+        pixels = max(self.MIN_PIXELS, min(pixels, self.MAX_POINTS // (2 * columns)))
+        for curve, group in zip(self.curves, self.groups):
+            xs, ys = [], []
+            for pyramid, offset, scale in group:
+                data = pyramid.data
+                col_stop = min(stop, len(data))
+                if col_stop <= start:
+                    continue
+                if col_stop - start <= pixels * 2:
+                    x = np.arange(start, col_stop)
+                    y = np.asarray(data[start:col_stop], dtype='float64')
+                else:
+                    x, y, _, _ = pyramid.envelope(start, col_stop, pixels)
+                xs.extend([x, x[-1:]])
+                ys.extend([(y - offset) / scale, [np.nan]])
+            if xs:
+                curve.setData(np.concatenate(xs), np.concatenate(ys), connect='finite')
+            else:
+                curve.clear()
+
+
 # ================== 数据表格模型 ==================
 class PandasModel(QAbstractTableModel):
+    """按列保存NumPy数组，单元格文本按行块批量格式化并放入LRU缓存"""
+    BLOCK_ROWS = 256  # 每次格式化的行数
+    CACHE_BLOCKS = 1024  # 最多缓存的(行块, 列)数量
+    FETCH_ROWS = 1000  # 每次向视图公开的行数，滚动到底部时再继续加载
+    SAMPLE_ROWS = 200  # 估算列宽时采样的行数
+
     def __init__(self, data):
         super().__init__()
+        self._filter_expr = None
+        self._sort_column = -1
+        self._sort_order = Qt.AscendingOrder
+        self.set_arrays(data)
+
+    def set_arrays(self, data):
         self._data = data
+        self._columns = [str(col) for col in data.columns]
+        # 内存映射或数值列取到的是视图，不会复制数据
+        self._arrays = [data.iloc[:, i].to_numpy() for i in range(data.shape[1])]
+        self._index = data.index
+        self._total_rows = data.shape[0]
+        # 排序和筛选只生成行号排列，显示时按排列取数据
+        self._order = self.compute_order()
+        self._rows = self._total_rows if self._order is None else len(self._order)
+        self._loaded_rows = min(self._rows, self.FETCH_ROWS)
+        self._cache = OrderedDict()
+
+    def compute_order(self):
+        rows = None
+        if self._filter_expr:
+            mask = self._data.eval(self._filter_expr)
+            mask = np.asarray(mask)
+            if mask.dtype != bool or mask.shape != (self._total_rows,):
+                raise ValueError("筛选表达式必须返回每一行的布尔值")
+            rows = np.flatnonzero(mask)
+        if 0 <= self._sort_column < len(self._arrays):
+            values = self._arrays[self._sort_column]
+            values = values if rows is None else values[rows]
+            if values.dtype.kind == 'O':
+                values = values.astype(str)
+            if self._sort_order == Qt.AscendingOrder:
+                perm = np.argsort(values, kind='stable')
+            else:
+                # 反转后稳定排序再反转，降序时相同值仍保持原有先后顺序
+                perm = len(values) - 1 - np.argsort(values[::-1], kind='stable')[::-1]
+            rows = perm if rows is None else rows[perm]
+        return rows
+
+    def apply_order(self, filter_expr, sort_column, sort_order):
+        old_state = (self._filter_expr, self._sort_column, self._sort_order)
+        self._filter_expr, self._sort_column, self._sort_order = filter_expr, sort_column, sort_order
+        try:
+            order = self.compute_order()
+        except Exception:
+            self._filter_expr, self._sort_column, self._sort_order = old_state
+            raise
+        self.beginResetModel()
+        self._order = order
+        self._rows = self._total_rows if order is None else len(order)
+        self._loaded_rows = min(self._rows, self.FETCH_ROWS)
+        self._cache.clear()
+        self.endResetModel()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.apply_order(self._filter_expr, column, order)
+
+    def set_filter(self, expr):
+        """按表达式筛选行，如 "t1 > 50 and t2 < 3"；表达式无效时抛出异常"""
+        self.apply_order(expr.strip() or None, self._sort_column, self._sort_order)
+
+    def visible_row_count(self):
+        return self._rows
 
     def rowCount(self, parent=None):
-        return self._data.shape[0]
+        if parent is not None and parent.isValid():
+            return 0
+        return self._loaded_rows
+
+    def canFetchMore(self, parent=None):
+        if parent is not None and parent.isValid():
+            return False
+        return self._loaded_rows < self._rows
+
+    def fetchMore(self, parent=None):
+        count = min(self.FETCH_ROWS, self._rows - self._loaded_rows)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded_rows, self._loaded_rows + count - 1)
+        self._loaded_rows += count
+        self.endInsertRows()
+
+    def append_data(self, data):
+        """数据只在末尾追加时通知视图插入新行，无需重置整个模型"""
+        old_rows, new_rows = self._total_rows, data.shape[0]
+        if new_rows < old_rows or self._order is not None:
+            # 排序或筛选时新行的位置不固定，重新计算排列
+            self.beginResetModel()
+            self.set_arrays(data)
+            self.endResetModel()
+            return
+        loaded_rows = self._loaded_rows
+        # 保留已公开的行数和已格式化的缓存，新行由fetchMore按需公开
+        cache = self._cache
+        self.set_arrays(data)
+        self._cache = cache
+        self._loaded_rows = loaded_rows
+        # 原来的最后一行可能被替换（加载时的临时行），它所在的块也要重新格式化
+        last_block = max(0, old_rows - 1) // self.BLOCK_ROWS
+        for key in [key for key in cache if key[0] >= last_block]:
+            del cache[key]
+        if loaded_rows == old_rows and new_rows > old_rows:
+            self.fetchMore()
 
     def columnCount(self, parent=None):
-        return self._data.shape[1]
+        return len(self._columns)
+
+    def format_block(self, block, column):
+        key = (block, column)
+        cells = self._cache.get(key)
+        if cells is not None:
+            self._cache.move_to_end(key)
+            return cells
+        start = block * self.BLOCK_ROWS
+        if self._order is None:
+            values = self._arrays[column][start:start + self.BLOCK_ROWS]
+        else:
+            values = self._arrays[column][self._order[start:start + self.BLOCK_ROWS]]
+        # 整块向量化转为字符串，避免逐个单元格iloc和str
+        cells = np.asarray(values).astype(str)
+        self._cache[key] = cells
+        if len(self._cache) > self.CACHE_BLOCKS:
+            self._cache.popitem(last=False)
+        return cells
 
     def data(self, index, role=Qt.DisplayRole):
         if role == Qt.DisplayRole:
-            return str(self._data.iloc[index.row(), index.column()])
+            row = index.row()
+            block = row // self.BLOCK_ROWS
+            return str(self.format_block(block, index.column())[row - block * self.BLOCK_ROWS])
         return None
 
     def headerData(self, section, orientation, role):
         if role == Qt.DisplayRole:
             if orientation == Qt.Horizontal:
-                return str(self._data.columns[section])
+                return self._columns[section]
             elif orientation == Qt.Vertical:
-                return str(self._data.index[section])
+                row = section if self._order is None else self._order[section]
+                return str(self._index[row])
         return None
 
+    def sample_column_widths(self, font_metrics, padding=24, max_width=300):
+        """按表头和前几行的文本估算列宽，不遍历整列"""
+        sample_blocks = range((min(self._rows, self.SAMPLE_ROWS) + self.BLOCK_ROWS - 1) // self.BLOCK_ROWS)
+        widths = []
+        for column, name in enumerate(self._columns):
+            texts = [name]
+            for block in sample_blocks:
+                texts.extend(self.format_block(block, column)[:self.SAMPLE_ROWS].tolist())
+            width = max(font_metrics.horizontalAdvance(text) for text in texts) + padding
+            widths.append(min(width, max_width))
+        return widths
+
+
+# ================== 后台分块加载线程 ==================
+class CSVLoadThread(QThread):
+    progress = pyqtSignal(int)
+    loaded = pyqtSignal(str, object, object, object, object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, model, file_path):
+        super().__init__()
+        self.model = model
+        self.file_path = file_path
+        self._cancelled = False
 
-# ================== CSV 数据模型 ==================
-class CSVModel:
-    def __init__(self):
-        self.df = pd.DataFrame()
-        self.stats = {}
-        self.config = self.load_config()
-        self.expected_max_lines = {}
-        self.selected_columns = []
-        self.alarm_history = []
-
-    def load_config(self):
-        config = configparser.ConfigParser()
-        config['EXPECTED_MAX'] = {
-            'enabled': 'True',
-            'default_value': '100',
-            'color': '#00FF00',
-            'width': '2',
-            'style': 'dash',
-            'alarm_threshold': '1.05'
-        }
-        config['COLUMN_SPECIFIC'] = {}
-
-        if os.path.exists('config.ini'):
-            config.read('config.ini')
-        else:
-            with open('config.ini', 'w') as configfile:
-                config.write(configfile)
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
 
-        return config
+    def run(self):
+        try:
+            result = self.model.prepare_data(self.file_path, self.progress.emit, self.is_cancelled)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        # 被取消时不回传数据
+        if result is not None:
+            df, stats, column_store, sketches = result
+            self.loaded.emit(self.file_path, df, stats, column_store, sketches)
 
-    def create_expected_max_line(self, column_name):
-        if column_name in self.expected_max_lines:
-            self.expected_max_lines[column_name].hide()
 
-        enabled = self.config.getboolean('EXPECTED_MAX', 'enabled')
-        if not enabled:
-            return None
+# ================== 后台配置写入线程 ==================
+class ConfigSaveThread(QThread):
+    """在后台写入配置文本，写入方式见CSVModel.write_config_file"""
+    failed = pyqtSignal(str)
 
+    def __init__(self, text, path='config.ini'):
+        super().__init__()
+        self.text = text
+        self.path = path
+
+    def run(self):
         try:
-            if column_name in self.config['COLUMN_SPECIFIC']:
-                max_value = float(self.config['COLUMN_SPECIFIC'][column_name])
-            else:
-                max_value = float(self.config.get('EXPECTED_MAX', 'default_value'))
-        except (ValueError, KeyError):
-            return None
+            CSVModel.write_config_file(self.path, self.text)
+        except OSError as e:
+            self.failed.emit(str(e))
 
-        color = self.config.get('EXPECTED_MAX', 'color')
-        width = self.config.getint('EXPECTED_MAX', 'width')
-        style = self.config.get('EXPECTED_MAX', 'style')
 
-        pen = pg.mkPen(color=color, width=width)
-        if style == 'dash':
+# ================== CSV 数据模型 ==================
+class CSVModel(CSVModelCore):
+    """在CSVModelCore之上提供预期最大值线等界面元素"""
+
+    def apply_config(self, config):
+        # 画笔和开关也先由新配置生成，出错时与基类一样不替换任何状态
+        pen = self.make_pen(ThresholdConfig(config))
+        overlay_normalized = config.getboolean('OVERLAY', 'normalize', fallback=False)
+        super().apply_config(config)
+        self.expected_max_pen = pen
+        # 界面开关的初始值取自配置，切换时不写入配置文件
+        self.overlay_normalized = overlay_normalized
+
+    @staticmethod
+    def make_pen(thresholds):
+        pen = pg.mkPen(color=thresholds.color, width=thresholds.width)
+        if thresholds.style == 'dash':
             pen.setStyle(Qt.DashLine)
-        elif style == 'dot':
+        elif thresholds.style == 'dot':
             pen.setStyle(Qt.DotLine)
-        elif style == 'dash-dot':
+        elif thresholds.style == 'dash-dot':
             pen.setStyle(Qt.DashDotLine)
+        return pen
+
+    def get_expected_max_pen(self):
+        """预期最大值线的画笔，配置加载时生成一次"""
+        return self.expected_max_pen
 
-        line = DraggableMaxLine(
+    def create_max_line(self, max_value=0.0):
+        """按配置样式创建预期最大值线，不登记到某一列，可在切换列时复用"""
+        return DraggableMaxLine(
             pos=max_value,
             angle=0,
-            pen=pen,
+            pen=self.get_expected_max_pen(),
             label=f'预期最大值: {max_value:.2f}',
             labelOpts={
                 'position': 0.95,
-                'color': color,
+                'color': self.thresholds.color,
                 'fill': (200, 200, 200, 100),
                 'movable': True
             }
         )
-        self.expected_max_lines[column_name] = line
-        return line
-
-    def update_expected_max(self, column_name, new_value):
-        if 'COLUMN_SPECIFIC' not in self.config:
-            self.config['COLUMN_SPECIFIC'] = {}
-        self.config['COLUMN_SPECIFIC'][column_name] = str(new_value)
-
-        try:
-            with open('config.ini', 'w') as configfile:
-                self.config.write(configfile)
-        except Exception as e:
-            print(f"更新配置文件失败: {e}")
 
     def load_csv(self, file_path):
         try:
-            # 尝试UTF-8编码
-            self.df = pd.read_csv(file_path, encoding='utf-8')
-        except UnicodeDecodeError:
-            # 尝试GBK编码
-            try:
-                self.df = pd.read_csv(file_path, encoding='gbk')
-            except Exception as e:
-                QMessageBox.critical(None, "文件读取错误",
-                                     f"无法读取文件: {e}\n请检查文件格式和编码")
-                return False
+            result = self.prepare_data(file_path)
+        except UnicodeDecodeError as e:
+            QMessageBox.critical(None, "文件读取错误",
+                                 f"无法读取文件: {e}\n请检查文件格式和编码")
+            return False
         except Exception as e:
             QMessageBox.critical(None, "文件读取错误",
                                  f"读取CSV失败: {e}")
             return False
 
-        # 清洗列名（移除空格和特殊字符）
-        self.df.columns = [col.strip().replace(' ', '_') for col in self.df.columns]
-        self.calculate_stats()
+        self.set_dataframe(*result)
         return True
 
-    def calculate_stats(self):
-        self.stats = {}
-        for col in self.df.columns:
-            if pd.api.types.is_numeric_dtype(self.df[col]):
-                col_stats = {
-                    'min': self.df[col].min(),
-                    'max': self.df[col].max(),
-                    'mean': self.df[col].mean(),
-                    'min_rows': self.df[self.df[col] == self.df[col].min()],
-                    'max_rows': self.df[self.df[col] == self.df[col].max()]
-                }
-                self.stats[col] = col_stats
-
-    def get_plot_data(self, column):
-        return self.df[column].values if column in self.df.columns else []
-
-    def set_selected_columns(self, columns):
-        self.selected_columns = columns
-
-    def get_expected_max(self, column_name):
-        """获取指定列的预期最大值"""
-        try:
-            if column_name in self.config['COLUMN_SPECIFIC']:
-                return float(self.config['COLUMN_SPECIFIC'][column_name])
-            else:
-                return float(self.config.get('EXPECTED_MAX', 'default_value'))
-        except (ValueError, KeyError):
-            return None
-
-    def check_max_value_alarm(self, column_name, max_value):
-        """检查最大值是否超过预期并触发报警"""
-        expected_max = self.get_expected_max(column_name)
-        if expected_max is None:
-            return False
-
-        alarm_threshold = float(self.config.get('EXPECTED_MAX', 'alarm_threshold', fallback='1.05'))
-        threshold_value = expected_max * alarm_threshold
-
-        if max_value > threshold_value:
-            # 记录报警历史
-            alarm_msg = f"{column_name}最大值{max_value:.2f}超过报警阈值{threshold_value:.2f}"
-            self.alarm_history.append(alarm_msg)
-            return True
-        return False
-
 
 # ================== 视图模型 ==================
 class CSVViewModel:
+    CONFIG_SAVE_DELAY_MS = 500  # 拖动预期最大值线停止后多久写回配置文件
+    CONFIG_POLL_MS = 1000  # 检查配置文件修改时间的间隔
+
     def __init__(self, model):
         self.model = model
         self.current_column = None
-        self.current_max_line = None
         self.selected_columns = []
         self.is_overlay_mode = False
-
-    def load_file(self, file_path):
-        success = self.model.load_csv(file_path)
+        self.rolling_statistic = None  # 叠加在曲线上的滚动统计量，None表示不显示
+        self.rolling_window = 100
+        self.config_thread = None
+        self.config_timer = QTimer()
+        self.config_timer.setSingleShot(True)
+        self.config_timer.setInterval(self.CONFIG_SAVE_DELAY_MS)
+        self.config_timer.timeout.connect(self.flush_config)
+
+    def create_load_thread(self, file_path):
+        """创建后台分块加载线程"""
+        return CSVLoadThread(self.model, file_path)
+
+    def load_file(self, file_path, df=None, stats=None, column_store=None, sketches=None):
+        # 后台线程已读取完成时直接使用其DataFrame
+        if df is not None:
+            self.model.set_dataframe(df, stats, column_store, sketches)
+            success = True
+        else:
+            success = self.model.load_csv(file_path)
         return success, self.model.df.columns.tolist() if success else []
 
+    def is_compact_loading(self):
+        return self.model.compact_dtypes
+
+    def set_compact_loading(self, enabled):
+        """切换压缩加载模式，对之后打开的文件生效，不写入配置文件"""
+        self.model.compact_dtypes = enabled
+
+    def get_memory_report(self):
+        return self.model.memory_report
+
+    def use_batched_overlay(self, columns):
+        """叠加列数达到阈值时改用高密度模式"""
+        return len(columns) >= self.model.config.getint('OVERLAY', 'batch_columns', fallback=10)
+
+    def is_overlay_normalized(self):
+        return self.model.overlay_normalized
+
+    def set_overlay_normalized(self, enabled):
+        self.model.overlay_normalized = enabled
+
+    def can_follow(self):
+        return self.model.can_follow()
+
+    def get_follow_interval(self):
+        return self.model.config.getint('LOAD', 'follow_interval_ms', fallback=1000)
+
+    def poll_follow(self):
+        """读取文件新追加的行，返回(起始行号, 行数)；没有新数据时返回None"""
+        new_rows = self.model.read_appended_rows()
+        if new_rows is None or new_rows.empty:
+            return None
+        start = self.model.append_rows(new_rows)
+        return start, len(new_rows)
+
     def get_column_stats(self, column):
-        if column in self.model.stats:
+        stats = self.model.get_stats(column)
+        if stats is not None:
             self.current_column = column
-            return self.model.stats[column]
-        return None
+        return stats
+
+    def get_quantiles(self, column, qs=(0.5, 0.95, 0.99)):
+        sketch = self.model.get_sketch(column)
+        return None if sketch is None else sketch.quantile(qs)
+
+    def get_distribution(self, column):
+        """返回(分箱边界, 计数)"""
+        sketch = self.model.get_sketch(column)
+        return (np.empty(0), np.empty(0)) if sketch is None else sketch.histogram()
+
+    def get_row(self, row_index):
+        """按行号取出一行数据"""
+        return self.model.df.iloc[row_index].to_dict()
 
     def get_plot_data(self, column=None):
         col = column or self.current_column
@@ -255,20 +576,83 @@ class CSVViewModel:
             return self.model.get_plot_data(col)
         return []
 
-    def get_expected_max_line(self, column_name):
-        line = self.model.create_expected_max_line(column_name)
-        if line:
-            line.sigPositionChanged.connect(
-                lambda pos: self.handle_line_moved(column_name, pos)
-            )
-            self.current_max_line = line
-        return line
+    def get_pyramid(self, column):
+        return self.model.get_pyramid(column)
+
+    def set_rolling(self, statistic, window):
+        self.rolling_statistic = statistic
+        self.rolling_window = window
 
-    def handle_line_moved(self, column_name, new_y):
+    def get_rolling_pyramid(self, column):
+        if self.rolling_statistic is None:
+            return None
+        return self.model.get_rolling_pyramid(column, self.rolling_window, self.rolling_statistic)
+
+    def get_rolling_label(self):
+        if self.rolling_statistic is None:
+            return None
+        return f"{RollingStats.STATISTICS[self.rolling_statistic]}({self.rolling_window})"
+
+    def create_max_line(self):
+        return self.model.create_max_line()
+
+    def get_max_line_value(self, column_name):
+        return self.model.get_max_line_value(column_name)
+
+    def handle_line_moved(self, column_name, new_y, line=None):
         new_value = round(new_y, 2)
         self.model.update_expected_max(column_name, new_value)
-        if self.current_max_line:
-            self.current_max_line.label.setText(f"预期最大值: {new_value:.2f}")
+        # 拖动中每次移动都会调用，只重启防抖定时器，停止拖动后再写文件
+        self.config_timer.start()
+        if line:
+            line.label.setText(f"预期最大值: {new_value:.2f}")
+
+    def flush_config(self, wait=False):
+        """把修改过的配置交给后台线程写回；wait=True时在当前线程写完再返回，用于退出前"""
+        self.config_timer.stop()
+        if wait:
+            if self.config_thread is not None:
+                self.config_thread.wait()
+                self.config_thread = None
+            if self.model.config_dirty:
+                try:
+                    CSVModel.write_config_file(self.model.config_path, self.model.serialize_config())
+                except OSError as e:
+                    self.on_config_save_failed(str(e))
+                self.model.config_mtime = self.model.get_config_mtime()
+            return
+        # 上一次写入未完成时，由on_config_saved在完成后再写
+        if self.config_thread is not None or not self.model.config_dirty:
+            return
+        self.config_thread = ConfigSaveThread(self.model.serialize_config(), self.model.config_path)
+        self.config_thread.failed.connect(self.on_config_save_failed)
+        self.config_thread.finished.connect(self.on_config_saved)
+        self.config_thread.start()
+
+    def on_config_saved(self):
+        self.config_thread = None
+        # 自己写入的文件不当作外部修改重新加载
+        self.model.config_mtime = self.model.get_config_mtime()
+        if self.model.config_dirty:
+            self.flush_config()
+
+    def on_config_save_failed(self, message):
+        print(f"更新配置文件失败: {message}")
+
+    def poll_config(self):
+        """配置文件被修改时重新加载，返回是否需要刷新图表；配置有误时抛出异常"""
+        if self.config_thread is not None:
+            return False
+        return self.model.reload_config_if_changed()
+
+    def get_config_path(self):
+        return self.model.config_path
+
+    def get_expected_max_pen(self):
+        return self.model.get_expected_max_pen()
+
+    def get_expected_max_color(self):
+        return self.model.thresholds.color
 
     def set_selected_columns(self, columns):
         self.model.set_selected_columns(columns)
@@ -281,6 +665,30 @@ class CSVViewModel:
         """检查当前列是否触发报警"""
         return self.model.check_max_value_alarm(column_name, max_value)
 
+    def is_column_alarmed(self, column_name):
+        """按当前预期最大值判断列是否处于报警状态，不记录报警历史"""
+        stats = self.get_column_stats(column_name)
+        return bool(stats) and self.model.is_max_value_alarm(column_name, stats['max'])
+
+    def get_exceedances(self, column_name, threshold, limit=5):
+        """返回超过阈值的点数和值最大的limit个行号"""
+        index = self.model.get_exceedance_index(column_name)
+        if index is None:
+            return 0, []
+        return index.count_above(threshold), index.rows_above(threshold, limit).tolist()
+
+    def query_alarm_history(self, column_name=None, since=None, until=None, limit=None):
+        return self.model.alarm_history.query(column_name, since, until, limit)
+
+    def close(self):
+        """退出前写回未保存的配置和报警历史"""
+        self.flush_config(wait=True)
+        self.model.alarm_history.close()
+
+    def get_alarm_events(self, column_name=None):
+        """报警规则事件表，column_name为None时覆盖所有数值列"""
+        return self.model.get_alarm_events(None if column_name is None else [column_name])
+
 
 # ================== 多列选择对话框 ==================
 class MultiColumnDialog(QDialog):
@@ -313,14 +721,261 @@ class MultiColumnDialog(QDialog):
                 if self.list_widget.item(i).checkState() == Qt.Checked]
 
 
+# ================== 图表元素复用 ==================
+class PlotItemManager:
+    """图表中一列数据的曲线、超限标记和预期最大值线只创建一次，切换列时只替换数据"""
+
+    def __init__(self, plot_widget, view_model, pen='b', symbol_brush='b', name='实际数据',
+                 symbol='o', alarm=True, line_pen=None, threshold_changed=None, rolling_pen=None):
+        self.plot_widget = plot_widget
+        self.view_model = view_model
+        self.threshold_changed = threshold_changed  # 拖动预期最大值线时和松开后回调，参数为列名
+        self.column = None
+        self.name = name  # 为None时图例显示列名
+        self.curve = plot_widget.plot(pen=pen, name=name, symbolSize=5, symbolBrush=symbol_brush)
+        self.alarm_item = None
+        if alarm:
+            self.alarm_item = plot_widget.plot(
+                pen=None,
+                symbol='x',
+                symbolSize=10,
+                symbolBrush='r',
+                name='超过预期值'
+            )
+            self.set_legend(self.alarm_item, None)
+        self.line = view_model.create_max_line()
+        self.line_pen = line_pen  # 为None时使用配置中的线型
+        if line_pen is not None:
+            self.line.setPen(line_pen)
+        self.line.hide()
+        plot_widget.addItem(self.line)
+        self.line.sigValueDragged.connect(self.on_line_moved)
+        self.line.sigDragFinished.connect(self.on_drag_finished)
+        self.decimator = DecimatedPlot(plot_widget, self.curve, None, symbol=symbol)
+        # 滚动统计曲线，数据同样按可见范围抽稀
+        self.rolling_curve = plot_widget.plot(
+            pen=rolling_pen if rolling_pen is not None else pg.mkPen('#ff8800', width=2))
+        self.rolling_curve.hide()
+        self.rolling_decimator = DecimatedPlot(plot_widget, self.rolling_curve, None, symbol=None)
+
+    def set_legend(self, item, name):
+        legend = self.plot_widget.getPlotItem().legend
+        if legend is None:
+            return
+        legend.removeItem(item)
+        if name:
+            legend.addItem(item, name)
+
+    def show_column(self, column, pyramid, alarm=False):
+        """切换到指定列：移动预期最大值线并替换曲线数据，返回预期最大值线（未启用时为None）"""
+        self.column = column
+        max_value = self.view_model.get_max_line_value(column)
+        line = None
+        if max_value is not None:
+            line = self.line
+            self.move_line(max_value)
+        self.line.setVisible(line is not None)
+
+        if self.name is None:
+            self.curve.opts['name'] = column
+            self.set_legend(self.curve, column)
+
+        self.decimator.line = line
+        self.set_alarm(alarm)
+        self.curve.show()
+        self.decimator.set_pyramid(pyramid)
+        self.show_rolling()
+        return line
+
+    def show_rolling(self):
+        """按视图模型当前的滚动统计设置更新叠加曲线"""
+        pyramid = None
+        if self.column is not None:
+            pyramid = self.view_model.get_rolling_pyramid(self.column)
+        label = self.view_model.get_rolling_label() if pyramid is not None else None
+        if label is not None and self.name is None:
+            label = f"{self.column} {label}"
+        self.set_legend(self.rolling_curve, label)
+        self.rolling_curve.setVisible(pyramid is not None)
+        self.rolling_decimator.set_pyramid(pyramid)
+
+    def set_alarm(self, alarm):
+        """切换超限标记的显示，标记位置由DecimatedPlot按可见范围计算"""
+        if self.alarm_item is None:
+            return
+        enabled = alarm and self.decimator.line is not None
+        if enabled == (self.decimator.alarm_item is not None):
+            return
+        self.decimator.alarm_item = self.alarm_item if enabled else None
+        if enabled:
+            self.decimator.update_alarms()
+        else:
+            self.alarm_item.clear()
+        self.alarm_item.setVisible(enabled)
+        self.set_legend(self.alarm_item, '超过预期值' if enabled else None)
+
+    def apply_config(self):
+        """配置重新加载后更新线型、位置和报警状态，曲线数据不变"""
+        if self.line_pen is None:
+            self.line.setPen(self.view_model.get_expected_max_pen())
+            self.line.label.setColor(self.view_model.get_expected_max_color())
+        if self.column is not None:
+            self.show_column(self.column, self.decimator.pyramid,
+                             self.view_model.is_column_alarmed(self.column))
+
+    def move_line(self, value):
+        """程序设置线的位置，不会发出拖动信号，也不会写回配置"""
+        self.line.setPos(value)
+        self.line.label.setText(f'预期最大值: {value:.2f}')
+
+    def refresh(self):
+        """数据追加后重新取当前列的金字塔"""
+        if self.column is not None:
+            self.decimator.set_pyramid(self.view_model.get_pyramid(self.column))
+            self.show_rolling()
+
+    def hide(self):
+        self.column = None
+        self.decimator.set_pyramid(None)
+        self.curve.hide()
+        self.show_rolling()
+        self.line.hide()
+        if self.alarm_item is not None:
+            self.alarm_item.hide()
+            self.set_legend(self.alarm_item, None)
+        if self.name is None:
+            self.set_legend(self.curve, None)
+
+    def on_line_moved(self, new_y):
+        if self.column is None:
+            return
+        self.view_model.handle_line_moved(self.column, new_y, self.line)
+        # 拖动过程中实时更新超限标记，只比较当前绘制的点
+        self.set_alarm(self.view_model.is_column_alarmed(self.column))
+        self.decimator.update_alarms()
+        if self.threshold_changed:
+            self.threshold_changed(self.column)
+
+    def on_drag_finished(self):
+        self.view_model.flush_config()
+        # 松开时line.dragging已复位，回调中重新评估一次报警规则
+        if self.column is not None and self.threshold_changed:
+            self.threshold_changed(self.column)
+
+
+# ================== 虚拟化多列图表 ==================
+class VirtualChartGrid(QScrollArea):
+    """多列图表网格：只为滚动到可见区域的行创建或复用图表，视口之外的列不绘制"""
+    MAX_COLS = 2
+    ROW_HEIGHT = 340
+    BUFFER_ROWS = 1  # 可见区域上下各多准备的行数，滚动时不出现空白
+
+    def __init__(self, view_model, parent=None):
+        super().__init__(parent)
+        self.view_model = view_model
+        self.columns = []
+        self.slots = []  # 复用的(分组框, 图表元素)
+        self.slot_index = []  # 每个槽位当前显示的列序号，空闲时为None
+        self.container = QWidget()
+        self.setWidgetResizable(True)
+        self.setWidget(self.container)
+        self.verticalScrollBar().valueChanged.connect(self.layout_slots)
+
+    def set_columns(self, columns):
+        self.columns = list(columns)
+        rows = (len(self.columns) + self.MAX_COLS - 1) // self.MAX_COLS
+        self.container.setMinimumHeight(rows * self.ROW_HEIGHT)
+        # 列或报警状态可能已改变，所有槽位重新取数
+        for k, (group_box, items) in enumerate(self.slots):
+            self.release_slot(k)
+        self.layout_slots()
+
+    def create_slot(self):
+        group_box = QGroupBox(self.container)
+        group_layout = QVBoxLayout(group_box)
+
+        plot_widget = pg.PlotWidget()
+        plot_widget.setBackground('w')
+        plot_widget.showGrid(x=True, y=True)
+        plot_widget.setLabel('bottom', '行号')
+        items = PlotItemManager(plot_widget, self.view_model, symbol=None)
+
+        group_layout.addWidget(plot_widget)
+        self.slots.append((group_box, items))
+        self.slot_index.append(None)
+        return len(self.slots) - 1
+
+    def show_slot(self, k, index):
+        group_box, items = self.slots[k]
+        column = self.columns[index]
+        group_box.setTitle(column)
+        items.plot_widget.setLabel('left', column)
+        self.slot_index[k] = index
+
+        # 检查是否触发报警，超过的点由DecimatedPlot按可见范围标记
+        stats = self.view_model.get_column_stats(column)
+        alarm = bool(stats) and self.view_model.check_alarm_for_column(column, stats['max'])
+        items.show_column(column, self.view_model.get_pyramid(column), alarm)
+
+    def release_slot(self, k):
+        group_box, items = self.slots[k]
+        items.hide()
+        group_box.hide()
+        self.slot_index[k] = None
+
+    def layout_slots(self, *args):
+        if not self.columns:
+            return
+        top = self.verticalScrollBar().value()
+        height = self.viewport().height()
+        width = self.viewport().width() // self.MAX_COLS
+        first_row = max(0, top // self.ROW_HEIGHT - self.BUFFER_ROWS)
+        last_row = (top + height) // self.ROW_HEIGHT + 1 + self.BUFFER_ROWS
+        wanted = range(first_row * self.MAX_COLS,
+                       min(len(self.columns), last_row * self.MAX_COLS))
+
+        # 仍在可见区域的槽位保持不动，其余槽位回收给新进入可见区域的列
+        kept = {index: k for k, index in enumerate(self.slot_index) if index in wanted}
+        free = [k for k, index in enumerate(self.slot_index) if index not in wanted]
+        for index in wanted:
+            k = kept.get(index)
+            if k is None:
+                k = free.pop() if free else self.create_slot()
+                self.show_slot(k, index)
+            group_box = self.slots[k][0]
+            row, col = divmod(index, self.MAX_COLS)
+            group_box.setGeometry(col * width, row * self.ROW_HEIGHT, width, self.ROW_HEIGHT)
+            group_box.show()
+        for k in free:
+            if self.slot_index[k] is not None:
+                self.release_slot(k)
+
+    def active_items(self):
+        return [items for group_box, items in self.slots if items.column is not None]
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.layout_slots()
+
+
 # ================== 主界面 ==================
 class CSVView(QMainWindow):
+    CLOSE_WAIT_MS = 3000  # 关闭窗口时等待后台加载线程结束的时间
+
     def __init__(self, view_model):
         super().__init__()
         self.view_model = view_model
-        self.plot_widgets = {}
         self.color_cycle = ['b', 'r', 'g', 'c', 'm', 'y', 'k']  # 曲线颜色循环
         self.alarm_points = {}  # 存储报警点数据
+        self.overlay_items = []  # 叠加模式下复用的图表元素，按颜色顺序
+        self.load_thread = None
+        self.progress_dialog = None
+        self.follow_timer = QTimer(self)
+        self.follow_timer.timeout.connect(self.poll_follow)
+        # 配置文件修改后自动应用到正在显示的图表
+        self.config_watch_timer = QTimer(self)
+        self.config_watch_timer.timeout.connect(self.poll_config)
+        self.config_watch_timer.start(CSVViewModel.CONFIG_POLL_MS)
         self.init_ui()
 
     def init_ui(self):
@@ -336,6 +991,12 @@ class CSVView(QMainWindow):
         control_layout = QHBoxLayout()
         self.open_btn = QPushButton('打开CSV文件')
         self.open_btn.clicked.connect(self.open_file)
+        self.open_dir_btn = QPushButton('打开文件夹')
+        self.open_dir_btn.clicked.connect(self.open_folder)
+        self.compact_cb = QCheckBox("压缩内存加载")
+        self.compact_cb.setChecked(self.view_model.is_compact_loading())
+        self.compact_cb.stateChanged.connect(
+            lambda state: self.view_model.set_compact_loading(state == Qt.Checked))
         self.column_selector = QComboBox()
         self.column_selector.currentIndexChanged.connect(self.update_single_display)
         self.config_btn = QPushButton('配置设置')
@@ -347,18 +1008,46 @@ class CSVView(QMainWindow):
         # 新增叠加模式复选框和返回单列按钮
         self.overlay_cb = QCheckBox("叠加对比模式")
         self.overlay_cb.stateChanged.connect(self.toggle_display_mode)
+        self.normalize_cb = QCheckBox("归一化")
+        self.normalize_cb.setToolTip("高密度叠加时把每列缩放到[0, 1]")
+        self.normalize_cb.setChecked(self.view_model.is_overlay_normalized())
+        self.normalize_cb.stateChanged.connect(self.toggle_overlay_normalize)
         self.return_single_btn = QPushButton("返回单列模式")
         self.return_single_btn.clicked.connect(self.return_to_single_mode)
         self.return_single_btn.setEnabled(False)
 
+        # 滚动统计叠加曲线：统计量和窗口长度
+        self.rolling_combo = QComboBox()
+        self.rolling_combo.addItem('无', None)
+        for statistic, label in RollingStats.STATISTICS.items():
+            self.rolling_combo.addItem(label, statistic)
+        self.rolling_combo.currentIndexChanged.connect(self.update_rolling)
+        self.rolling_window_spin = QSpinBox()
+        self.rolling_window_spin.setRange(2, 1000000)
+        self.rolling_window_spin.setValue(self.view_model.rolling_window)
+        self.rolling_window_spin.setToolTip("窗口行数")
+        self.rolling_window_spin.editingFinished.connect(self.update_rolling)
+
+        # 跟踪模式：定时读取文件新追加的行
+        self.follow_cb = QCheckBox("跟踪文件追加")
+        self.follow_cb.setEnabled(False)
+        self.follow_cb.stateChanged.connect(self.toggle_follow_mode)
+
         control_layout.addWidget(self.open_btn)
+        control_layout.addWidget(self.open_dir_btn)
+        control_layout.addWidget(self.compact_cb)
         control_layout.addWidget(QLabel('单列选择:'))
         control_layout.addWidget(self.column_selector)
         control_layout.addWidget(self.config_btn)
         control_layout.addWidget(QLabel('多列分析:'))
         control_layout.addWidget(self.multi_select_btn)
         control_layout.addWidget(self.overlay_cb)
+        control_layout.addWidget(self.normalize_cb)
         control_layout.addWidget(self.return_single_btn)
+        control_layout.addWidget(self.follow_cb)
+        control_layout.addWidget(QLabel('滚动统计:'))
+        control_layout.addWidget(self.rolling_combo)
+        control_layout.addWidget(self.rolling_window_spin)
         control_layout.addStretch()
 
         # 主内容区 - 堆叠布局
@@ -371,32 +1060,66 @@ class CSVView(QMainWindow):
 
         splitter = QSplitter(Qt.Horizontal)
         self.table_view = QTableView()
-        self.table_view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        # 列宽由采样估算，避免Stretch模式遍历整个模型测量内容
+        self.table_view.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.table_view.horizontalHeader().setStretchLastSection(True)
+        # 点击表头排序，初始不排序
+        self.table_view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table_view.setSortingEnabled(True)
+
+        # 左侧面板：筛选栏 + 数据表格
+        left_panel = QWidget()
+        left_layout = QVBoxLayout(left_panel)
+        left_layout.setContentsMargins(0, 0, 0, 0)
+        filter_layout = QHBoxLayout()
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("筛选表达式，如: t1 > 50 and t2 < 3")
+        self.filter_edit.returnPressed.connect(self.apply_table_filter)
+        self.filter_btn = QPushButton("筛选")
+        self.filter_btn.clicked.connect(self.apply_table_filter)
+        self.clear_filter_btn = QPushButton("清除")
+        self.clear_filter_btn.clicked.connect(self.clear_table_filter)
+        filter_layout.addWidget(self.filter_edit)
+        filter_layout.addWidget(self.filter_btn)
+        filter_layout.addWidget(self.clear_filter_btn)
+        left_layout.addLayout(filter_layout)
+        left_layout.addWidget(self.table_view)
 
         # 右侧面板
         right_panel = QWidget()
         right_layout = QVBoxLayout(right_panel)
         self.stats_display = QTextEdit()
         self.stats_display.setReadOnly(True)
+        # 分布直方图：复用同一个柱状图元素，切换列时只更新数据
+        self.distribution_plot = pg.PlotWidget()
+        self.distribution_plot.setBackground('w')
+        self.distribution_plot.setMaximumHeight(150)
+        self.distribution_plot.setMouseEnabled(x=False, y=False)
+        self.distribution_bars = pg.BarGraphItem(x0=[], x1=[], height=[], brush=(100, 150, 220))
+        self.distribution_plot.addItem(self.distribution_bars)
         self.single_plot_widget = pg.PlotWidget()
         self.single_plot_widget.setBackground('w')
         self.single_plot_widget.showGrid(x=True, y=True)
         self.single_plot_widget.addLegend()
+        self.single_items = PlotItemManager(self.single_plot_widget, self.view_model,
+                                            threshold_changed=self.on_single_threshold_changed)
 
         # 添加报警信息显示区域
         self.alarm_display = QTextEdit()
+        self.alarm_events_text = ""  # 上次计算的规则事件文本，拖动预期最大值线时沿用
         self.alarm_display.setReadOnly(True)
         self.alarm_display.setStyleSheet("background-color: #ffeeee;")
         self.alarm_display.setMaximumHeight(150)
 
         right_layout.addWidget(QLabel('统计信息:'))
         right_layout.addWidget(self.stats_display)
+        right_layout.addWidget(self.distribution_plot)
         right_layout.addWidget(QLabel('报警信息:'))
         right_layout.addWidget(self.alarm_display)
         right_layout.addWidget(QLabel('数据可视化:'))
         right_layout.addWidget(self.single_plot_widget)
 
-        splitter.addWidget(self.table_view)
+        splitter.addWidget(left_panel)
         splitter.addWidget(right_panel)
         splitter.setSizes([600, 400])
         single_layout.addWidget(splitter)
@@ -405,23 +1128,25 @@ class CSVView(QMainWindow):
         self.multi_display_widget = QWidget()
         multi_layout = QVBoxLayout(self.multi_display_widget)
 
-        scroll_area = QScrollArea()
-        scroll_area.setWidgetResizable(True)
-        self.multi_chart_container = QWidget()
-        self.chart_grid = QGridLayout(self.multi_chart_container)
-        scroll_area.setWidget(self.multi_chart_container)
+        self.chart_grid = VirtualChartGrid(self.view_model)
 
         multi_layout.addWidget(QLabel('多列数据分析:'))
-        multi_layout.addWidget(scroll_area)
+        multi_layout.addWidget(self.chart_grid)
 
         # 叠加对比区域
         self.overlay_display_widget = QWidget()
-        overlay_layout = QVBoxLayout(self.overlay_display_widget)
+        overlay_layout = QHBoxLayout(self.overlay_display_widget)
         self.overlay_plot_widget = pg.PlotWidget()
         self.overlay_plot_widget.setBackground('w')
         self.overlay_plot_widget.showGrid(x=True, y=True)
         self.overlay_plot_widget.addLegend()
+        self.batched_overlay = BatchedOverlay(self.overlay_plot_widget, self.color_cycle)
+        # 高密度模式的图例单独列出，不占用绘图区
+        self.overlay_legend = QListWidget()
+        self.overlay_legend.setMaximumWidth(200)
+        self.overlay_legend.hide()
         overlay_layout.addWidget(self.overlay_plot_widget)
+        overlay_layout.addWidget(self.overlay_legend)
 
         self.stacked_layout.addWidget(self.single_display_widget)
         self.stacked_layout.addWidget(self.multi_display_widget)
@@ -438,42 +1163,204 @@ class CSVView(QMainWindow):
             self, "打开CSV文件", "", "CSV文件 (*.csv);;所有文件 (*)"
         )
         if file_path:
-            success, columns = self.view_model.load_file(file_path)
-            if success:
-                self.update_table()
-                self.column_selector.clear()
-                self.column_selector.addItems(columns)
-                if columns:
-                    self.column_selector.setCurrentIndex(0)
-                    self.multi_select_btn.setEnabled(True)
-                self.single_display_widget.show()
-                self.multi_display_widget.hide()
-                self.overlay_display_widget.hide()
-                self.return_single_btn.setEnabled(False)
+            self.start_loading(file_path)
+
+    def open_folder(self):
+        """打开文件夹，合并其中所有CSV文件"""
+        dir_path = QFileDialog.getExistingDirectory(self, "选择CSV文件夹", "")
+        if dir_path:
+            self.start_loading(dir_path)
+
+    def start_loading(self, file_path):
+        """在后台线程中分块加载CSV，界面保持响应"""
+        self.open_btn.setEnabled(False)
+        self.open_dir_btn.setEnabled(False)
+        self.progress_dialog = QProgressDialog("正在加载CSV文件...", "取消", 0, 100, self)
+        self.progress_dialog.setWindowTitle("加载中")
+        self.progress_dialog.setWindowModality(Qt.WindowModal)
+        self.progress_dialog.setAutoClose(False)
+        self.progress_dialog.setMinimumDuration(0)
+
+        self.load_thread = self.view_model.create_load_thread(file_path)
+        self.load_thread.progress.connect(self.progress_dialog.setValue)
+        self.load_thread.loaded.connect(self.on_file_loaded)
+        self.load_thread.failed.connect(self.on_load_failed)
+        self.load_thread.finished.connect(self.on_load_thread_finished)
+        self.progress_dialog.canceled.connect(self.load_thread.cancel)
+        self.load_thread.start()
+
+    def on_load_thread_finished(self):
+        if self.progress_dialog:
+            self.progress_dialog.close()
+            self.progress_dialog = None
+        self.load_thread = None
+        self.open_btn.setEnabled(True)
+        self.open_dir_btn.setEnabled(True)
+
+    def on_load_failed(self, message):
+        QMessageBox.critical(self, "文件读取错误",
+                             f"读取CSV失败: {message}\n请检查文件格式和编码")
+
+    def on_file_loaded(self, file_path, df, stats, column_store, sketches):
+        self.follow_cb.setChecked(False)
+        success, columns = self.view_model.load_file(file_path, df, stats, column_store, sketches)
+        if success:
+            # 旧文件的曲线不再有效，释放数据但保留图表元素供新文件复用
+            for items in self.active_plot_items():
+                items.hide()
+            self.batched_overlay.clear()
+            self.follow_cb.setEnabled(self.view_model.can_follow())
+            self.update_table()
+            self.column_selector.clear()
+            self.column_selector.addItems(columns)
+            if columns:
+                self.column_selector.setCurrentIndex(0)
+                self.multi_select_btn.setEnabled(True)
+            self.single_display_widget.show()
+            self.multi_display_widget.hide()
+            self.overlay_display_widget.hide()
+            self.return_single_btn.setEnabled(False)
+            self.show_memory_report()
+
+    def show_memory_report(self):
+        report = self.view_model.get_memory_report()
+        if report:
+            self.statusBar().showMessage(
+                f"内存占用: {report['before'] / 1024 / 1024:.1f}MB → "
+                f"{report['after'] / 1024 / 1024:.1f}MB")
+        else:
+            self.statusBar().clearMessage()
 
     def update_table(self):
         model = PandasModel(self.view_model.model.df)
+        self.table_view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.filter_edit.clear()
         self.table_view.setModel(model)
+        header = self.table_view.horizontalHeader()
+        for i, width in enumerate(model.sample_column_widths(header.fontMetrics())):
+            header.resizeSection(i, width)
+
+    def apply_table_filter(self):
+        model = self.table_view.model()
+        if not isinstance(model, PandasModel):
+            return
+        try:
+            model.set_filter(self.filter_edit.text())
+        except Exception as e:
+            QMessageBox.warning(self, "筛选失败", f"无效的筛选表达式: {e}")
+            return
+        self.statusBar().showMessage(f"筛选结果: {model.visible_row_count()} 行")
+
+    def clear_table_filter(self):
+        self.filter_edit.clear()
+        self.apply_table_filter()
+
+    def update_rolling(self):
+        statistic = self.rolling_combo.currentData()
+        window = self.rolling_window_spin.value()
+        if (statistic, window) == (self.view_model.rolling_statistic, self.view_model.rolling_window):
+            return
+        self.view_model.set_rolling(statistic, window)
+        for items in self.active_plot_items():
+            items.show_rolling()
+
+    # ================ 跟踪模式 ================
+    def toggle_follow_mode(self):
+        if self.follow_cb.isChecked():
+            self.follow_timer.start(self.view_model.get_follow_interval())
+        else:
+            self.follow_timer.stop()
+
+    def poll_follow(self):
+        try:
+            result = self.view_model.poll_follow()
+        except (ValueError, OSError) as e:
+            self.follow_cb.setChecked(False)
+            QMessageBox.warning(self, "跟踪停止", f"读取追加数据失败: {e}")
+            return
+        if result is None:
+            return
+
+        start, count = result
+        table_model = self.table_view.model()
+        if isinstance(table_model, PandasModel):
+            table_model.append_data(self.view_model.model.df)
+
+        # 只向已有曲线补充数据，不清除重建图表
+        for items in self.active_plot_items():
+            items.refresh()
+        if any(self.batched_overlay.groups):
+            self.generate_overlay_chart(self.view_model.selected_columns)
+
+        column = self.single_items.column
+        if column is not None:
+            stats = self.view_model.get_column_stats(column)
+            self.show_column_stats(column, stats)
+            if self.single_items.line.isVisible():
+                self.update_alarm_display(column, stats, self.single_items.line)
+        self.statusBar().showMessage(f"已追加 {count} 行，共 {start + count} 行")
+
+    def active_plot_items(self):
+        yield self.single_items
+        yield from self.chart_grid.active_items()
+        yield from self.overlay_items
 
     # ================ 配置操作 ================
     def edit_config(self):
+        # 先写回拖动产生的修改，编辑器里看到的是最新配置
+        self.view_model.flush_config(wait=True)
+        path = self.view_model.get_config_path()
         try:
             if sys.platform == 'win32':
-                os.startfile('config.ini')
+                os.startfile(path)
             elif sys.platform == 'darwin':
-                os.system('open config.ini')
+                subprocess.Popen(['open', path])
             else:
-                os.system('xdg-open config.ini')
+                subprocess.Popen(['xdg-open', path])
         except Exception as e:
             QMessageBox.warning(self, "打开失败",
-                                f"无法打开配置文件: {e}\n请手动编辑config.ini")
+                                f"无法打开配置文件: {e}\n请手动编辑{path}")
 
         QMessageBox.information(
             self,
             "配置更新",
-            "配置文件已打开。修改后请重新选择列以应用新配置。"
+            "配置文件已打开。保存后新配置会自动应用到当前图表。"
         )
 
+    def poll_config(self):
+        try:
+            reloaded = self.view_model.poll_config()
+        except (configparser.Error, ValueError) as e:
+            # 有误的配置不应用，继续使用原配置，文件再次修改时重新检查
+            self.statusBar().showMessage("配置文件有误，未应用修改: " + " ".join(str(e).split()))
+            return
+        if not reloaded:
+            return
+        # 重新加载后开关以配置文件为准，勾选状态随之同步（归一化变化时会重绘叠加图）
+        self.compact_cb.setChecked(self.view_model.is_compact_loading())
+        self.normalize_cb.setChecked(self.view_model.is_overlay_normalized())
+        for items in self.active_plot_items():
+            items.apply_config()
+        column = self.single_items.column
+        if column is not None and self.single_items.line.isVisible():
+            stats = self.view_model.get_column_stats(column)
+            if stats:
+                self.update_alarm_display(column, stats, self.single_items.line, record=False)
+        self.statusBar().showMessage("配置文件已更新")
+
+    def closeEvent(self, event):
+        if self.load_thread is not None:
+            # 先取消后台加载；限时内未结束时先隐藏窗口，线程结束后再关闭，避免销毁运行中的线程
+            self.load_thread.cancel()
+            if not self.load_thread.wait(self.CLOSE_WAIT_MS):
+                self.load_thread.finished.connect(self.close)
+                self.hide()
+                event.ignore()
+                return
+        # 退出前写回尚未保存的预期最大值和报警历史
+        self.view_model.close()
+        super().closeEvent(event)
+
     # ================ 多列选择 ================
     def select_multiple_columns(self):
         dialog = MultiColumnDialog(self.view_model.model.df.columns.tolist(), self)
@@ -520,167 +1407,175 @@ class CSVView(QMainWindow):
 
     # ================ 图表生成 ================
     def generate_multi_charts(self, columns):
-        # 清除旧图表
-        for i in reversed(range(self.chart_grid.count())):
-            widget = self.chart_grid.itemAt(i).widget()
-            if widget:
-                widget.deleteLater()
-        self.plot_widgets.clear()
-
-        # 生成新图表
-        row, col = 0, 0
-        max_cols = 2
-
-        for column in columns:
-            group_box = QGroupBox(column)
-            group_layout = QVBoxLayout(group_box)
-
-            plot_widget = pg.PlotWidget()
-            plot_widget.setBackground('w')
-            plot_widget.showGrid(x=True, y=True)
-            plot_widget.setMinimumHeight(300)
-
-            plot_data = self.view_model.get_plot_data(column)
-            if plot_data.size > 0:
-                plot_widget.plot(plot_data, pen='b', name='实际数据')
-
-                expected_max_line = self.view_model.get_expected_max_line(column)
-                if expected_max_line:
-                    plot_widget.addItem(expected_max_line)
-
-                # 检查是否触发报警
-                stats = self.view_model.get_column_stats(column)
-                if stats and self.view_model.check_alarm_for_column(column, stats['max']):
-                    # 标记超过的点
-                    indices = np.where(plot_data > expected_max_line.value())[0]
-                    if indices.size > 0:
-                        plot_widget.plot(
-                            indices,
-                            plot_data[indices],
-                            pen=None,
-                            symbol='x',
-                            symbolSize=10,
-                            symbolBrush='r',
-                            name='超过预期值'
-                        )
-
-                plot_widget.setLabel('left', column)
-                plot_widget.setLabel('bottom', '行号')
-
-            group_layout.addWidget(plot_widget)
-            self.chart_grid.addWidget(group_box, row, col)
-            self.plot_widgets[column] = plot_widget
-
-            col += 1
-            if col >= max_cols:
-                col = 0
-                row += 1
+        # 图表只为可见行创建，滚动时复用
+        self.chart_grid.set_columns(columns)
 
     # ================ 叠加对比图表 ================
     def generate_overlay_chart(self, columns):
         """生成叠加对比图表（核心功能）"""
-        self.overlay_plot_widget.clear()
         self.overlay_plot_widget.setTitle("多列数据对比")
         self.overlay_plot_widget.setLabel('left', '数值')
         self.overlay_plot_widget.setLabel('bottom', '行号')
-        self.overlay_plot_widget.addLegend()
-
-        # 获取多列数据
-        plot_data = self.view_model.get_multi_plot_data()
 
-        # 为每条曲线设置不同颜色和样式
-        for i, column in enumerate(columns):
-            if column not in plot_data:
+        if self.view_model.use_batched_overlay(columns):
+            self.generate_batched_overlay(columns)
+            return
+        self.batched_overlay.clear()
+        self.overlay_legend.hide()
+
+        # 为每条曲线设置不同颜色和样式，曲线和预期最大值线按颜色顺序复用
+        while len(self.overlay_items) < len(columns):
+            color = self.color_cycle[len(self.overlay_items) % len(self.color_cycle)]
+            self.overlay_items.append(PlotItemManager(
+                self.overlay_plot_widget, self.view_model,
+                pen=pg.mkPen(color, width=2),
+                symbol_brush=color,
+                name=None,
+                alarm=False,  # 叠加图不标记报警点
+                line_pen=pg.mkPen(color, width=1, style=Qt.DashLine),
+                rolling_pen=pg.mkPen(color, width=2, style=Qt.DotLine)
+            ))
+
+        for i, items in enumerate(self.overlay_items):
+            pyramid = self.view_model.get_pyramid(columns[i]) if i < len(columns) else None
+            if pyramid is None:
+                items.hide()
                 continue
+            # 数据由共用的金字塔按可见范围提供
+            items.decimator.symbol = 'o' if len(columns) < 5 else None
+            items.show_column(columns[i], pyramid)
 
-            color = self.color_cycle[i % len(self.color_cycle)]
-            data = plot_data[column]
-
-            # 绘制曲线
-            self.overlay_plot_widget.plot(
-                data,
-                pen=pg.mkPen(color, width=2),
-                name=column,
-                symbol='o' if len(columns) < 5 else None,
-                symbolSize=5,
-                symbolBrush=color
-            )
+    def generate_batched_overlay(self, columns):
+        """高密度叠加：不创建逐列曲线和预期最大值线，同色曲线合并为一条路径"""
+        for items in self.overlay_items:
+            items.hide()
 
-            # 添加预期最大值线
-            expected_max_line = self.view_model.get_expected_max_line(column)
-            if expected_max_line:
-                expected_max_line.setPen(pg.mkPen(color, width=1, style=Qt.DashLine))
-                self.overlay_plot_widget.addItem(expected_max_line)
+        names, pyramids = [], []
+        for column in columns:
+            pyramid = self.view_model.get_pyramid(column)
+            if pyramid is not None and len(pyramid.data) > 0:
+                names.append(column)
+                pyramids.append(pyramid)
+
+        normalize = self.normalize_cb.isChecked()
+        if normalize:
+            self.overlay_plot_widget.setLabel('left', '归一化数值')
+        self.batched_overlay.set_columns(pyramids, normalize)
+
+        self.overlay_legend.clear()
+        for i, column in enumerate(names):
+            item = QListWidgetItem(column)
+            item.setForeground(pg.mkColor(self.color_cycle[i % len(self.color_cycle)]))
+            self.overlay_legend.addItem(item)
+        self.overlay_legend.show()
+
+    def toggle_overlay_normalize(self):
+        self.view_model.set_overlay_normalized(self.normalize_cb.isChecked())
+        if self.overlay_display_widget.isVisible():
+            self.generate_overlay_chart(self.view_model.selected_columns)
 
     # ================ 单列显示更新 ================
+    def show_column_stats(self, column, stats):
+        stats_text = f"=== {column} ===\n"
+        stats_text += f"最小值: {stats['min']:.4f}\n"
+        stats_text += f"最大值: {stats['max']:.4f}\n"
+        stats_text += f"平均值: {stats['mean']:.4f}\n"
+        quantiles = self.view_model.get_quantiles(column)
+        if quantiles is not None:
+            stats_text += "分位数(近似): " + "  ".join(
+                f"P{q}: {value:.4f}" for q, value in zip((50, 95, 99), quantiles)) + "\n"
+        stats_text += "\n"
+
+        stats_text += f"有效值个数: {stats['count']}\n"
+        stats_text += f"缺失值个数: {stats['nan_count']}\n\n"
+
+        if stats['argmin'] >= 0:
+            stats_text += "最小值所在行:\n"
+            stats_text += f"• 行{stats['argmin'] + 1}: {self.view_model.get_row(stats['argmin'])}\n"
+
+            stats_text += "\n最大值所在行:\n"
+            stats_text += f"• 行{stats['argmax'] + 1}: {self.view_model.get_row(stats['argmax'])}\n"
+
+        self.stats_display.setText(stats_text)
+        self.show_distribution(column)
+
+    def show_distribution(self, column):
+        edges, counts = self.view_model.get_distribution(column)
+        self.distribution_bars.setOpts(x0=edges[:-1], x1=edges[1:], height=counts)
+        self.distribution_plot.setTitle(f"{column} 分布")
+
+    def update_alarm_display(self, column, stats, expected_max_line, record=True, rules=True):
+        """检查最大值是否超过预期，返回是否触发报警；拖动线时record=False，不记录报警历史；
+        rules=False时沿用上次的规则事件文本，拖动过程中不重新评估报警规则"""
+        if record:
+            alarm = self.view_model.check_alarm_for_column(column, stats['max'])
+        else:
+            alarm = self.view_model.is_column_alarmed(column)
+        if rules:
+            self.alarm_events_text = self.format_alarm_events(column)
+        events_text = self.alarm_events_text
+        if alarm:
+            # 在报警区域显示信息，超限点数和所在行由排序索引二分查找得到
+            expected_max = expected_max_line.value()
+            count, rows = self.view_model.get_exceedances(column, expected_max)
+            alarm_msg = (f"警报: {column}最大值{stats['max']:.4f}超过预期值!\n"
+                         f"预期值: {expected_max:.4f} 实际值: {stats['max']:.4f}\n"
+                         f"超过预期值的点: {count} 个，最高点所在行: "
+                         + ", ".join(str(row + 1) for row in rows))
+            self.alarm_display.setText(alarm_msg + events_text)
+            self.alarm_display.setStyleSheet("background-color: #ffeeee; color: #cc0000;")
+            return True
+        if events_text:
+            self.alarm_display.setText("最大值未超过报警阈值" + events_text)
+            self.alarm_display.setStyleSheet("background-color: #fff8e0; color: #996600;")
+            return False
+        self.alarm_display.setText("无报警 - 所有值在预期范围内")
+        self.alarm_display.setStyleSheet("background-color: #eeffee; color: #006600;")
+        return False
+
+    def format_alarm_events(self, column, limit=3):
+        """按规则汇总报警事件，每条规则列出峰值最高的几个区间"""
+        events = self.view_model.get_alarm_events(column)
+        if events.empty:
+            return ""
+        text = "\n\n规则报警事件:"
+        for rule, group in events.groupby('rule', sort=False):
+            text += f"\n• {rule}: {len(group)} 次"
+            for event in group.nlargest(limit, 'peak').itertuples():
+                text += f"\n    行{event.start + 1}-{event.end + 1} 峰值 {event.peak:.4f}"
+        return text
+
+    def on_single_threshold_changed(self, column):
+        stats = self.view_model.get_column_stats(column)
+        if stats:
+            # 拖动中只更新最大值报警，松开后再重新计算规则事件
+            self.update_alarm_display(column, stats, self.single_items.line, record=False,
+                                      rules=not self.single_items.line.dragging)
+
     def update_single_display(self):
         column = self.column_selector.currentText()
         stats = self.view_model.get_column_stats(column)
 
         if stats:
-            stats_text = f"=== {column} ===\n"
-            stats_text += f"最小值: {stats['min']:.4f}\n"
-            stats_text += f"最大值: {stats['max']:.4f}\n"
-            stats_text += f"平均值: {stats['mean']:.4f}\n\n"
+            self.show_column_stats(column, stats)
 
-            stats_text += "最小值所在行:\n"
-            for _, row in stats['min_rows'].iterrows():
-                stats_text += f"• 行{row.name + 1}: {row.to_dict()}\n"
-
-            stats_text += "\n最大值所在行:\n"
-            for _, row in stats['max_rows'].iterrows():
-                stats_text += f"• 行{row.name + 1}: {row.to_dict()}\n"
-
-            self.stats_display.setText(stats_text)
-
-            # 更新图表
-            self.single_plot_widget.clear()
+            # 更新图表：复用曲线和预期最大值线，只替换数据
             plot_data = self.view_model.get_plot_data()
 
             if plot_data.size > 0:
-                # 绘制主数据曲线
-                self.single_plot_widget.plot(
-                    plot_data,
-                    pen='b',
-                    name='实际数据',
-                    symbol='o',
-                    symbolSize=5,
-                    symbolBrush='b'
-                )
-
-                # 添加预期最大值线
-                expected_max_line = self.view_model.get_expected_max_line(column)
-                if expected_max_line:
-                    self.single_plot_widget.addItem(expected_max_line)
-
-                    # 检查最大值是否超过预期并触发报警
-                    if self.view_model.check_alarm_for_column(column, stats['max']):
-                        # 在图表上标记超过的点
-                        indices = np.where(plot_data > expected_max_line.value())[0]
-                        if indices.size > 0:
-                            # 用红色叉号标记超过的点
-                            self.single_plot_widget.plot(
-                                indices,
-                                plot_data[indices],
-                                pen=None,
-                                symbol='x',
-                                symbolSize=10,
-                                symbolBrush='r',
-                                name='超过预期值'
-                            )
-
-                        # 在报警区域显示信息
-                        alarm_msg = (f"警报: {column}最大值{stats['max']:.4f}超过预期值!\n"
-                                     f"预期值: {expected_max_line.value():.4f} 实际值: {stats['max']:.4f}")
-                        self.alarm_display.setText(alarm_msg)
-                        self.alarm_display.setStyleSheet("background-color: #ffeeee; color: #cc0000;")
-                    else:
-                        self.alarm_display.setText("无报警 - 所有值在预期范围内")
-                        self.alarm_display.setStyleSheet("background-color: #eeffee; color: #006600;")
+                alarm = False
+                max_value = self.view_model.get_max_line_value(column)
+                if max_value is not None:
+                    # 检查最大值是否超过预期并触发报警，超过的点用红色叉号标记
+                    self.single_items.move_line(max_value)
+                    alarm = self.update_alarm_display(column, stats, self.single_items.line)
+                self.single_items.show_column(column, self.view_model.get_pyramid(column), alarm)
 
                 self.single_plot_widget.setTitle(f"{column} 数据分析")
                 self.single_plot_widget.setLabel('left', column)
                 self.single_plot_widget.setLabel('bottom', '行号')
+            else:
+                self.single_items.hide()
 
 
 # ================== 主程序入口 ==================